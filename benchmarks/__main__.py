@@ -0,0 +1,253 @@
+"""
+Benchmarks of the tax lookup and application hot paths.
+
+Run from the repository root:
+
+    python -m benchmarks --save results.json
+    python -m benchmarks --compare results.json
+
+API calls go to the fake TaxJar server and the cache is locmem, so results
+measure this package rather than the network.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+django.setup()
+
+from django.core.cache import cache  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.test import override_settings  # noqa: E402
+from prices import Money  # noqa: E402
+
+from django_prices_taxjar import LineItem, utils  # noqa: E402
+from django_prices_taxjar.fake_server import FakeTaxJarServer  # noqa: E402
+from django_prices_taxjar.models import Tax  # noqa: E402
+
+BENCHMARKS = []
+
+LETTERS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+DIGITS = '0123456789' + LETTERS
+
+
+def get_summary_rates(count):
+    """Build a summary rates response with count distinct regions."""
+
+    summary_rates = []
+    for index in range(count):
+        country, region = divmod(index, len(DIGITS) ** 2)
+        summary_rates.append({
+            'country_code': LETTERS[country // 26] + LETTERS[country % 26],
+            'country': 'Country',
+            'region_code': DIGITS[region // 36] + DIGITS[region % 36],
+            'region': 'Region',
+            'minimum_rate': {'label': 'State Tax', 'rate': '0.065'},
+            'average_rate': {'label': 'Tax', 'rate': '0.0827'}})
+    return {'summary_rates': summary_rates}
+
+
+def benchmark(rounds, setup=None):
+    """Register a benchmark timed rounds times, after an untimed setup."""
+
+    def decorator(function):
+        BENCHMARKS.append((function.__name__, function, setup, rounds))
+        return function
+
+    return decorator
+
+
+def _clear_region():
+    cache.delete(utils._get_region_cache_key('US', 'CA'))
+
+
+def _clear_address():
+    cache.delete(utils.make_address_cache_key('05495-2086', 'US', 'VT'))
+
+
+def _clear_tax_rows():
+    Tax.objects.all().delete()
+    cache.clear()
+
+
+def _get_line_items(count):
+    return [LineItem(str(index), 1, Money('15.00', 'USD'), '20010')
+            for index in range(count)]
+
+
+LINE_ITEMS = {count: _get_line_items(count) for count in (1, 50, 1000)}
+SUMMARY_RATES = {count: get_summary_rates(count) for count in (100, 10000)}
+BASES = [Money(index % 1000, 'USD') for index in range(100000)]
+
+
+@benchmark(rounds=10000)
+def region_cache_hit():
+    utils.get_tax_rates_for_region('US', 'CA')
+
+
+@benchmark(rounds=1000, setup=_clear_region)
+def region_db_fallback():
+    utils.get_tax_rates_for_region('US', 'CA')
+
+
+@benchmark(rounds=10000)
+def address_cache_hit():
+    utils.get_tax_for_address('05495-2086', 'US', 'VT')
+
+
+@benchmark(rounds=200, setup=_clear_address)
+def address_cache_miss():
+    utils.get_tax_for_address('05495-2086', 'US', 'VT')
+
+
+def _order_benchmark(count, rounds):
+    def order():
+        utils.get_taxes_for_order(
+            Money('1.5', 'USD'), 'US', '90002', 'CA',
+            line_items=LINE_ITEMS[count])
+
+    order.__name__ = 'order_{}_line_items'.format(count)
+    benchmark(rounds)(order)
+
+
+_order_benchmark(1, 200)
+_order_benchmark(50, 100)
+_order_benchmark(1000, 20)
+
+
+def _create_objects_benchmark(count, rounds):
+    def create_objects():
+        utils.create_objects_from_json(SUMMARY_RATES[count])
+
+    create_objects.__name__ = 'create_objects_{}_rows'.format(count)
+    benchmark(rounds, setup=_clear_tax_rows)(create_objects)
+
+
+_create_objects_benchmark(100, 20)
+_create_objects_benchmark(10000, 3)
+
+
+@benchmark(rounds=5)
+def flat_tax_100k_calls():
+    tax = utils.get_flat_tax('0.0827')
+    for base in BASES:
+        tax(base)
+
+
+@benchmark(rounds=5)
+def flat_tax_100k_apply_many():
+    utils.get_flat_tax('0.0827').apply_many(BASES)
+
+
+def prepare():
+    server = FakeTaxJarServer().start()
+    override_settings(TAXJAR_API=server.url).enable()
+    call_command('migrate', verbosity=0)
+    utils.create_objects_from_json({
+        'summary_rates': [{
+            'country_code': 'US', 'country': 'United States',
+            'region_code': 'CA', 'region': 'California',
+            'minimum_rate': {'label': 'State Tax', 'rate': '0.065'},
+            'average_rate': {'label': 'Tax', 'rate': '0.0827'}}]})
+    return server
+
+
+def run_benchmark(function, setup, rounds):
+    timings = []
+    for _ in range(rounds):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return {
+        'rounds': rounds,
+        'min': min(timings),
+        'max': max(timings),
+        'mean': statistics.mean(timings),
+        'median': statistics.median(timings),
+        'stddev': statistics.stdev(timings) if rounds > 1 else 0}
+
+
+def run(selected):
+    results = {}
+    # Run the region and address benchmarks against a populated database
+    # before the create_objects ones empty it.
+    for name, function, setup, rounds in BENCHMARKS:
+        if selected and not any(part in name for part in selected):
+            continue
+        # Warm up, so the first round does not pay for connections.
+        if setup is not None:
+            setup()
+        function()
+        results[name] = run_benchmark(function, setup, rounds)
+        print('{:<32} median {:>12.1f} us  ({} rounds)'.format(
+            name, results[name]['median'] * 1e6, rounds))
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print the change of every median, return the regressed names."""
+
+    regressions = []
+    print()
+    print('{:<32} {:>14} {:>14} {:>8}'.format(
+        'benchmark', 'baseline (us)', 'current (us)', 'change'))
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]['median']
+        change = (result['median'] - before) / before
+        print('{:<32} {:>14.1f} {:>14.1f} {:>+7.1%}'.format(
+            name, before * 1e6, result['median'] * 1e6, change))
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument(
+        '-k', dest='selected', action='append',
+        help='Only run benchmarks whose name contains this, repeatable')
+    parser.add_argument('--save', help='Write the results to this JSON file')
+    parser.add_argument(
+        '--compare', help='Compare the medians with this saved JSON file')
+    parser.add_argument(
+        '--threshold', type=float, default=0.1,
+        help='Relative slowdown reported as a regression (default 0.1)')
+    options = parser.parse_args(argv)
+
+    server = prepare()
+    try:
+        results = run(options.selected)
+    finally:
+        server.stop()
+
+    if options.save:
+        with open(options.save, 'w') as output:
+            json.dump({
+                'machine': {
+                    'python': platform.python_version(),
+                    'django': django.get_version(),
+                    'platform': platform.platform()},
+                'benchmarks': results}, output, indent=2, sort_keys=True)
+    if options.compare:
+        with open(options.compare) as baseline_file:
+            baseline = json.load(baseline_file)['benchmarks']
+        regressions = compare(results, baseline, options.threshold)
+        if regressions:
+            print('\nRegressed by more than {:.0%}: {}'.format(
+                options.threshold, ', '.join(regressions)))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
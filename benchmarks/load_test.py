@@ -0,0 +1,166 @@
+"""
+Load test driving concurrent checkouts against the fake TaxJar server.
+
+Run from the repository root:
+
+    python -m benchmarks.load_test --concurrency 32 --checkouts 5000 \
+        --latency 0.05 --error-rate 0.01 --rate-limit-rate 0.01
+
+Every checkout looks up the tax for an address, applies it and gets the
+taxes for an order through the public utils functions, over real HTTP.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+
+_database = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False)
+os.environ.setdefault('TAXJAR_BENCHMARK_DATABASE', _database.name)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+django.setup()
+
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import override_settings  # noqa: E402
+from prices import Money  # noqa: E402
+
+from django_prices_taxjar import LineItem, utils  # noqa: E402
+from django_prices_taxjar.fake_server import FakeTaxJarServer  # noqa: E402
+
+LINE_ITEMS = [
+    LineItem('1', 1, Money('15.00', 'USD'), '20010'),
+    LineItem('2', 2, Money('4.99', 'USD'), '40030'),
+    LineItem('3', 1, Money('120.00', 'USD'))]
+
+
+def get_postal_codes(count, seed):
+    generator = random.Random(seed)
+    return ['{:05d}'.format(generator.randrange(100000))
+            for _ in range(count)]
+
+
+def percentile(timings, fraction):
+    return timings[int(fraction * (len(timings) - 1))]
+
+
+class LoadTest(object):
+    """
+    Run checkouts on a pool of threads and collect their latencies.
+
+    Postal codes are picked with a skewed distribution, so a few are hot
+    and most are rarely seen, as in real traffic.
+    """
+
+    def __init__(self, postal_codes, seed=None):
+        self.postal_codes = postal_codes
+        self.timings = []
+        self.errors = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def pick_postal_code(self):
+        with self._lock:
+            index = int(self._random.paretovariate(1.2)) - 1
+        return self.postal_codes[index % len(self.postal_codes)]
+
+    def checkout(self, _=None):
+        postal_code = self.pick_postal_code()
+        started = time.perf_counter()
+        try:
+            tax = utils.get_tax_for_address(postal_code, 'US', 'CA')
+            tax(Money('139.99', 'USD'))
+            utils.get_taxes_for_order(
+                Money('5.00', 'USD'), 'US', postal_code, 'CA',
+                line_items=LINE_ITEMS)
+        except Exception as error:
+            with self._lock:
+                self.errors[type(error).__name__] += 1
+        finally:
+            connection.close()
+        duration = time.perf_counter() - started
+        with self._lock:
+            self.timings.append(duration)
+
+    def run(self, checkouts, concurrency):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(self.checkout, range(checkouts)))
+        return time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.load_test')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--checkouts', type=int, default=2000)
+    parser.add_argument(
+        '--addresses', type=int, default=500,
+        help='Number of distinct postal codes')
+    parser.add_argument(
+        '--latency', type=float, default=0.02,
+        help='Seconds the fake server adds to every response')
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', help='Write the report to this JSON file')
+    options = parser.parse_args(argv)
+
+    server = FakeTaxJarServer(
+        latency=options.latency, error_rate=options.error_rate,
+        rate_limit_rate=options.rate_limit_rate, seed=options.seed).start()
+    override_settings(
+        TAXJAR_API=server.url,
+        TAXJAR_POOL_SIZE=options.concurrency,
+        TAXJAR_MAX_CONCURRENCY=options.concurrency).enable()
+    try:
+        call_command('migrate', verbosity=0)
+        utils.call_with_retries(
+            lambda: utils.refresh_tax_rates(utils.stream_tax_rates()),
+            backoff=0.1)
+        load_test = LoadTest(
+            get_postal_codes(options.addresses, options.seed),
+            seed=options.seed)
+        elapsed = load_test.run(options.checkouts, options.concurrency)
+    finally:
+        server.stop()
+        os.unlink(_database.name)
+
+    timings = sorted(load_test.timings)
+    report = {
+        'checkouts': len(timings),
+        'concurrency': options.concurrency,
+        'seconds': elapsed,
+        'throughput': len(timings) / elapsed,
+        'latency_ms': {
+            'p50': percentile(timings, 0.5) * 1000,
+            'p90': percentile(timings, 0.9) * 1000,
+            'p99': percentile(timings, 0.99) * 1000,
+            'max': timings[-1] * 1000},
+        'errors': dict(load_test.errors),
+        'server_responses': {
+            '{} {}'.format(status, path): count
+            for (path, status), count in sorted(server.requests.items())},
+        'circuit': utils.get_circuit_breaker().state}
+
+    print('{checkouts} checkouts on {concurrency} threads in {seconds:.2f} s,'
+          ' {throughput:.1f} checkouts/s'.format(**report))
+    print('latency p50 {p50:.1f} ms, p90 {p90:.1f} ms, p99 {p99:.1f} ms, '
+          'max {max:.1f} ms'.format(**report['latency_ms']))
+    print('errors: {}'.format(report['errors'] or 'none'))
+    print('server responses: {}'.format(report['server_responses']))
+    print('circuit: {}'.format(report['circuit']))
+    if options.save:
+        with open(options.save, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
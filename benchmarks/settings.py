@@ -0,0 +1,21 @@
+import os
+
+SECRET_KEY = 'irrelevant'
+
+INSTALLED_APPS = ['django_prices_taxjar']
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        # The load test needs a file shared by its threads.
+        'NAME': os.environ.get('TAXJAR_BENCHMARK_DATABASE', ':memory:')}}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 100000}}}
+
+TAXJAR_ACCESS_KEY = 'benchmark'
+
+# Pointed at the stub server by the benchmark runner.
+TAXJAR_API = 'http://127.0.0.1/v2/'
@@ -1,38 +1,118 @@
-from decimal import Decimal
-from typing import Union
+from decimal import Decimal, ROUND_HALF_UP, localcontext
+from typing import Iterable, Union
 
-from django.conf import settings
+from babel.numbers import get_currency_precision
 
-from prices import Money, TaxedMoney
+from prices import flat_tax, Money, TaxedMoney
 
-try:
-    DEFAULT_TAXJAR_PRODUCT_TAX_CODE = settings.DEFAULT_TAXJAR_PRODUCT_TAX_CODE
-except AttributeError:
-    # Use blank, as it will default to a nonspecific value.
-    DEFAULT_TAXJAR_PRODUCT_TAX_CODE = ''
+from .conf import taxjar_settings
+
+
+def __getattr__(name):
+    # Settings used to be read into module constants at import time.
+    if name == 'DEFAULT_TAXJAR_PRODUCT_TAX_CODE':
+        return taxjar_settings.DEFAULT_TAXJAR_PRODUCT_TAX_CODE
+    raise AttributeError(
+        'module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+def _serialize_line_item(id, quantity, unit_price, product_tax_code,
+                         discount):
+    return {
+        'id': id,
+        'quantity': quantity,
+        'unit_price': str(unit_price.amount),
+        'product_tax_code': (
+            product_tax_code or
+            taxjar_settings.DEFAULT_TAXJAR_PRODUCT_TAX_CODE),
+        'discount': str(discount.amount) if discount else 0
+    }
 
 
 class LineItem(object):
-    """Helper object for unifying input for order based taxes."""
+    """
+    Helper object for unifying input for order based taxes.
+
+    Line items are immutable, so their serialized form is computed once.
+    """
+
+    __slots__ = ('id', 'quantity', 'unit_price', 'product_tax_code',
+                 'discount', '_dictionary')
 
     def __init__(self, id: str, quantity: int, unit_price: Money,
                  product_tax_code: str=None, discount: Money=None):
-        self.id = id
-        self.quantity = quantity
-        self.unit_price = unit_price
-        self.product_tax_code = product_tax_code
-        self.discount = discount
+        set_attr = super().__setattr__
+        set_attr('id', id)
+        set_attr('quantity', quantity)
+        set_attr('unit_price', unit_price)
+        set_attr('product_tax_code', product_tax_code)
+        set_attr('discount', discount)
+        set_attr('_dictionary', None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('LineItem is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('LineItem is immutable')
+
+    def __reduce__(self):
+        return (LineItem, (self.id, self.quantity, self.unit_price,
+                           self.product_tax_code, self.discount))
+
+    def __repr__(self):
+        return 'LineItem(%r, %r, %r, %r, %r)' % (
+            self.id, self.quantity, self.unit_price, self.product_tax_code,
+            self.discount)
 
     @property
     def dictionary(self):
-        return {
-            'id': self.id,
-            'quantity': self.quantity,
-            'unit_price': str(self.unit_price.amount),
-            'product_tax_code': (self.product_tax_code or
-                                 DEFAULT_TAXJAR_PRODUCT_TAX_CODE),
-            'discount': str(self.discount.amount) if self.discount else 0
-        }
+        dictionary = self._dictionary
+        if dictionary is None:
+            dictionary = _serialize_line_item(
+                self.id, self.quantity, self.unit_price,
+                self.product_tax_code, self.discount)
+            super().__setattr__('_dictionary', dictionary)
+        return dictionary
+
+
+class LineItemBatch(object):
+    """
+    Columnar collection of line items for large orders.
+
+    Stores every field in its own list and serializes straight to the
+    line_items payload without creating a LineItem per row.
+    """
+
+    __slots__ = ('ids', 'quantities', 'unit_prices', 'product_tax_codes',
+                 'discounts')
+
+    def __init__(self):
+        self.ids = []
+        self.quantities = []
+        self.unit_prices = []
+        self.product_tax_codes = []
+        self.discounts = []
+
+    def append(self, id: str, quantity: int, unit_price: Money,
+               product_tax_code: str=None, discount: Money=None):
+        self.ids.append(id)
+        self.quantities.append(quantity)
+        self.unit_prices.append(unit_price)
+        self.product_tax_codes.append(product_tax_code)
+        self.discounts.append(discount)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return map(LineItem, self.ids, self.quantities, self.unit_prices,
+                   self.product_tax_codes, self.discounts)
+
+    @property
+    def dictionaries(self):
+        return list(map(
+            _serialize_line_item, self.ids, self.quantities,
+            self.unit_prices, self.product_tax_codes, self.discounts))
 
 
 def tax_amount(base: Union[Money, TaxedMoney], amount: Decimal, *,
@@ -56,3 +136,92 @@ def tax_amount(base: Union[Money, TaxedMoney], amount: Decimal, *,
         else:
             gross = base + Money(amount, base.currency).quantize()
             return TaxedMoney(net=base, gross=gross)
+
+
+def _get_exponent(currency, exponents):
+    exp = exponents.get(currency)
+    if exp is None:
+        exp = exponents[currency] = \
+            Decimal('0.1') ** get_currency_precision(currency)
+    return exp
+
+
+class FlatTax(object):
+    """Tax callable applying a flat rate, see prices.flat_tax."""
+
+    __slots__ = ('rate', 'fraction')
+
+    def __init__(self, rate: Decimal):
+        self.rate = rate
+        self.fraction = Decimal(1) + rate
+
+    def __call__(self, base, keep_gross=False):
+        return flat_tax(base, self.rate, keep_gross=keep_gross)
+
+    def apply_many(self, bases: Iterable[Union[Money, TaxedMoney]],
+                   keep_gross=False):
+        """
+        Apply the tax to many values in a single pass.
+
+        Results are the same as calling the tax on every value, but the
+        decimal context and the per-currency exponents are set up only once.
+        """
+        fraction = self.fraction
+        exponents = {}
+        results = []
+        with localcontext() as context:
+            context.rounding = ROUND_HALF_UP
+            for base in bases:
+                if isinstance(base, TaxedMoney):
+                    net, gross = base.net, base.gross
+                elif isinstance(base, Money):
+                    net = gross = base
+                else:
+                    results.append(self(base, keep_gross=keep_gross))
+                    continue
+                currency = gross.currency
+                exp = _get_exponent(currency, exponents)
+                if keep_gross:
+                    net = Money(
+                        (net.amount / fraction).quantize(exp), currency)
+                else:
+                    gross = Money(
+                        (gross.amount * fraction).quantize(exp), currency)
+                results.append(TaxedMoney(net=net, gross=gross))
+        return results
+
+
+class AmountTax(object):
+    """Tax callable applying a fixed amount, see tax_amount."""
+
+    __slots__ = ('amount',)
+
+    def __init__(self, amount: Decimal):
+        self.amount = amount
+
+    def __call__(self, base, keep_gross=False):
+        return tax_amount(base, self.amount, keep_gross=keep_gross)
+
+    def apply_many(self, bases: Iterable[Union[Money, TaxedMoney]],
+                   keep_gross=False):
+        """Apply the tax to many values in a single pass."""
+        amount = self.amount
+        exponents = {}
+        results = []
+        with localcontext() as context:
+            context.rounding = ROUND_HALF_UP
+            for base in bases:
+                if isinstance(base, TaxedMoney):
+                    net, gross = base.net, base.gross
+                else:
+                    net = gross = base
+                currency = gross.currency
+                tax = Money(
+                    amount.quantize(_get_exponent(currency, exponents)),
+                    currency)
+                if keep_gross:
+                    net = net - tax
+                else:
+                    gross = gross + tax
+                results.append(TaxedMoney(net=net, gross=gross))
+        return results
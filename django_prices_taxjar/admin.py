@@ -3,4 +3,13 @@ from django.contrib import admin
 from .models import Tax
 
 
-admin.site.register(Tax)
+@admin.register(Tax)
+class TaxAdmin(admin.ModelAdmin):
+    list_display = [
+        'country_code', 'region_code', 'average_rate', 'minimum_rate']
+    list_filter = ['country_code']
+    ordering = ['country_code', 'region_code']
+
+    def get_queryset(self, request):
+        # The rate columns are enough for listings, skip decoding the JSON.
+        return super().get_queryset(request).defer('data')
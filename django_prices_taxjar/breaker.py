@@ -0,0 +1,64 @@
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the API while the circuit is open."""
+
+
+class CircuitBreaker(object):
+    """
+    Stop calling the API after consecutive failures.
+
+    Calls slower than latency_budget seconds count as failures too.  After
+    failure_threshold of them in a row the circuit opens and calls fail fast
+    with CircuitOpenError.  Once reset_timeout seconds have passed, a single
+    probe call is let through: the circuit closes if it succeeds and opens
+    again if it fails.  A failure_threshold of 0 disables the breaker.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float,
+                 latency_budget: float=None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.latency_budget = latency_budget
+        self.state = CLOSED
+        self.failures = 0
+        self._opened = None
+        self._lock = threading.Lock()
+
+    def is_probe_due(self):
+        """Whether the next call would be let through as a probe."""
+        return self.state == OPEN and (
+            time.monotonic() - self._opened >= self.reset_timeout)
+
+    def allow(self):
+        if not self.failure_threshold or self.state == CLOSED:
+            return True
+        with self._lock:
+            if self.is_probe_due():
+                self.state = HALF_OPEN
+                return True
+            return False
+
+    def record_success(self, duration: float):
+        if self.latency_budget is not None and duration > self.latency_budget:
+            self.record_failure()
+            return
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        if not self.failure_threshold:
+            return
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (
+                    self.failures >= self.failure_threshold):
+                self.state = OPEN
+                self._opened = time.monotonic()
@@ -0,0 +1,384 @@
+import array
+import functools
+import heapq
+import itertools
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+
+_NOT_LOADED = object()
+
+_MASK_64 = (1 << 64) - 1
+
+
+class LocalCache(object):
+    """
+    Thread-safe in-process cache bounded by entry count and age.
+
+    Least recently used entries are evicted once max_entries is reached.
+    """
+
+    def __init__(self, max_entries: int, timeout: float):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, expires = self._data[key]
+            except KeyError:
+                return default
+            if expires <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout: float=None):
+        if timeout is None:
+            timeout = self.timeout
+        expires = time.monotonic() + timeout
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class VersionedValue(object):
+    """
+    Process-local copy of a value, reloaded when its shared version changes.
+
+    The version stamp lives in the shared cache and is checked at most every
+    check_interval seconds, so after invalidate() is called in one process
+    the others serve the old value for at most that long.
+    """
+
+    def __init__(self, get_cache, version_key, load, check_interval: float):
+        self.get_cache = get_cache
+        self.version_key = version_key
+        self.load = load
+        self.check_interval = check_interval
+        self._value = _NOT_LOADED
+        self._version = None
+        self._checked = 0
+        self._lock = threading.Lock()
+
+    def _is_stale(self, now):
+        return (self._value is _NOT_LOADED or
+                now - self._checked >= self.check_interval)
+
+    def get(self):
+        now = time.monotonic()
+        if self._is_stale(now):
+            with self._lock:
+                if self._is_stale(now):
+                    cache = self.get_cache()
+                    version = cache.get(self.version_key)
+                    if version is None:
+                        # The stamp was evicted, start a new one so that
+                        # every process reloads.
+                        version = uuid.uuid4().hex
+                        if not cache.add(self.version_key, version, None):
+                            version = cache.get(self.version_key)
+                    if self._value is _NOT_LOADED or version != self._version:
+                        self._value = self.load()
+                        self._version = version
+                    self._checked = now
+        return self._value
+
+    def invalidate(self):
+        """Make every process reload the value on its next check."""
+        self.get_cache().set(self.version_key, uuid.uuid4().hex, None)
+        with self._lock:
+            self._value = _NOT_LOADED
+
+
+class TieredCache(object):
+    """
+    In-process LocalCache in front of a shared Django cache.
+
+    Reads are served from the local tier when possible and fall through to
+    the shared one, writes go to both.  add() is only forwarded to the
+    shared cache, as it is used for cross-process locks.
+
+    Local entries live at most as long as the local tier's timeout.  After
+    invalidate() is called in one process, the others drop their local tier
+    once they see the new version stamp, which they check at most every
+    check_interval seconds.
+
+    listener, if given, is called with the tier ('local' or 'shared'), the
+    outcome ('hit' or 'miss') and the number of keys after every lookup.
+    """
+
+    def __init__(self, shared, local: LocalCache, version_key,
+                 check_interval: float, listener=None):
+        self.shared = shared
+        self.listener = listener
+        self.local = local
+        self.version_key = version_key
+        self.check_interval = check_interval
+        self.stats = Counter()
+        self._version = None
+        self._checked = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+    def _check_version(self):
+        now = time.monotonic()
+        if self._checked is not None and (
+                now - self._checked < self.check_interval):
+            return
+        with self._lock:
+            if self._checked is not None and (
+                    now - self._checked < self.check_interval):
+                return
+            version = self.shared.get(self.version_key)
+            if version is None:
+                version = uuid.uuid4().hex
+                if not self.shared.add(self.version_key, version, None):
+                    version = self.shared.get(self.version_key)
+            if version != self._version:
+                self.local.clear()
+                self._version = version
+            self._checked = now
+
+    def _local_timeout(self, timeout):
+        if timeout is None:
+            return self.local.timeout
+        return min(timeout, self.local.timeout)
+
+    def _count(self, tier, hits, misses):
+        with self._stats_lock:
+            self.stats[tier + '_hits'] += hits
+            self.stats[tier + '_misses'] += misses
+        if self.listener is not None:
+            if hits:
+                self.listener(tier, 'hit', hits)
+            if misses:
+                self.listener(tier, 'miss', misses)
+
+    def get(self, key, default=None):
+        self._check_version()
+        value = self.local.get(key, _NOT_LOADED)
+        if value is not _NOT_LOADED:
+            self._count('local', 1, 0)
+            return value
+        value = self.shared.get(key, _NOT_LOADED)
+        if value is _NOT_LOADED:
+            self._count('local', 0, 1)
+            self._count('shared', 0, 1)
+            return default
+        self._count('local', 0, 1)
+        self._count('shared', 1, 0)
+        self.local.set(key, value)
+        return value
+
+    def get_many(self, keys):
+        self._check_version()
+        found = {}
+        missing = []
+        for key in keys:
+            value = self.local.get(key, _NOT_LOADED)
+            if value is _NOT_LOADED:
+                missing.append(key)
+            else:
+                found[key] = value
+        self._count('local', len(found), len(missing))
+        if missing:
+            shared = self.shared.get_many(missing)
+            self._count('shared', len(shared), len(missing) - len(shared))
+            for key, value in shared.items():
+                self.local.set(key, value)
+            found.update(shared)
+        return found
+
+    def set(self, key, value, timeout=None):
+        self._check_version()
+        self.shared.set(key, value, timeout)
+        local_timeout = self._local_timeout(timeout)
+        if local_timeout > 0:
+            self.local.set(key, value, local_timeout)
+        else:
+            self.local.delete(key)
+
+    def set_many(self, data, timeout=None):
+        self._check_version()
+        self.shared.set_many(data, timeout)
+        local_timeout = self._local_timeout(timeout)
+        for key, value in data.items():
+            if local_timeout > 0:
+                self.local.set(key, value, local_timeout)
+            else:
+                self.local.delete(key)
+
+    def add(self, key, value, timeout=None):
+        return self.shared.add(key, value, timeout)
+
+    def delete(self, key):
+        self.local.delete(key)
+        return self.shared.delete(key)
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        for key in keys:
+            self.local.delete(key)
+        self.shared.delete_many(keys)
+
+    def invalidate(self):
+        """Make every process drop its local tier on its next check."""
+        version = uuid.uuid4().hex
+        self.shared.set(self.version_key, version, None)
+        with self._lock:
+            self.local.clear()
+            self._version = version
+            self._checked = time.monotonic()
+
+
+class FrequencySketch(object):
+    """
+    Bounded estimate of the most frequently recorded items.
+
+    Frequencies are estimated with a count-min sketch of depth rows of width
+    counters, and only the max_entries items with the highest estimates are
+    kept.  Counters are halved every 10 * width records, so the estimates
+    follow recent traffic.
+
+    The kept items are also in a min-heap whose counts are lower bounds of
+    their estimates, so most records of cold items are rejected in constant
+    time and the others pay a logarithmic eviction.
+    """
+
+    def __init__(self, max_entries: int, width: int=4096, depth: int=4):
+        self.max_entries = max_entries
+        self.width = width
+        self.depth = depth
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._rows = [array.array('L', [0]) * self.width
+                      for _ in range(self.depth)]
+        self._top = {}
+        self._heap = []
+        self._sequence = itertools.count()
+        self._records = 0
+
+    def _increment(self, item):
+        # hash((seed, item)) shifts every row by the same offset, so rows
+        # collide together.  Scramble hash(item) with splitmix64 per row.
+        item_hash = hash(item) & _MASK_64
+        estimate = None
+        for seed, row in enumerate(self._rows):
+            mixed = (item_hash + (seed + 1) * 0x9E3779B97F4A7C15) & _MASK_64
+            mixed = ((mixed ^ (mixed >> 30)) * 0xBF58476D1CE4E5B9) & _MASK_64
+            mixed = ((mixed ^ (mixed >> 27)) * 0x94D049BB133111EB) & _MASK_64
+            index = (mixed ^ (mixed >> 31)) % self.width
+            row[index] += 1
+            if estimate is None or row[index] < estimate:
+                estimate = row[index]
+        return estimate
+
+    def _age(self):
+        for row in self._rows:
+            for index, count in enumerate(row):
+                row[index] = count >> 1
+        self._top = {
+            item: (count >> 1, value)
+            for item, (count, value) in self._top.items() if count >> 1}
+        self._heap = [(count, next(self._sequence), item)
+                      for item, (count, _) in self._top.items()]
+        heapq.heapify(self._heap)
+
+    def _coldest(self):
+        # Heap counts lag behind the estimates of items recorded since they
+        # were pushed, refresh them until the smallest one is current.
+        while True:
+            count, _, item = self._heap[0]
+            current = self._top[item][0]
+            if count == current:
+                return count
+            heapq.heapreplace(
+                self._heap, (current, next(self._sequence), item))
+
+    def record(self, item, value=None):
+        """
+        Count an occurrence of item.
+
+        value, e.g. the arguments needed to rebuild item, is kept with it
+        and returned by most_common().
+        """
+
+        with self._lock:
+            estimate = self._increment(item)
+            self._records += 1
+            if item in self._top:
+                self._top[item] = (estimate, value)
+            elif len(self._top) < self.max_entries:
+                self._top[item] = (estimate, value)
+                heapq.heappush(
+                    self._heap, (estimate, next(self._sequence), item))
+            elif (self._heap and estimate > self._heap[0][0] and
+                    estimate > self._coldest()):
+                _, _, coldest = heapq.heapreplace(
+                    self._heap, (estimate, next(self._sequence), item))
+                del self._top[coldest]
+                self._top[item] = (estimate, value)
+            if self._records >= 10 * self.width:
+                self._records = 0
+                self._age()
+
+    def most_common(self, n: int=None):
+        """Get (item, count, value) tuples, the most frequent first."""
+
+        with self._lock:
+            items = sorted(
+                ((item, count, value)
+                 for item, (count, value) in self._top.items()),
+                key=lambda entry: entry[1], reverse=True)
+        return items if n is None else items[:n]
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+
+def lazy_lru_cache(get_maxsize):
+    """
+    Like functools.lru_cache, but with the size resolved on the first call.
+
+    cache_clear() drops the cache, so the size is resolved again.
+    """
+
+    def decorator(function):
+        cached = None
+
+        @functools.wraps(function)
+        def wrapper(*args):
+            nonlocal cached
+            if cached is None:
+                cached = functools.lru_cache(maxsize=get_maxsize())(function)
+            return cached(*args)
+
+        def cache_clear():
+            nonlocal cached
+            cached = None
+
+        wrapper.cache_clear = cache_clear
+        return wrapper
+
+    return decorator
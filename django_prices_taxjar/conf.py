@@ -0,0 +1,115 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+
+REQUIRED = object()
+
+# Attribute name: (Django setting, default value)
+DEFAULTS = {
+    'ACCESS_KEY': ('TAXJAR_ACCESS_KEY', REQUIRED),
+    'TAXJAR_API': ('TAXJAR_API', 'https://api.taxjar.com/v2/'),
+    'DEFAULT_TAXJAR_PRODUCT_TAX_CODE': (
+        # Use blank, as it will default to a nonspecific value.
+        'DEFAULT_TAXJAR_PRODUCT_TAX_CODE', ''),
+    'CACHE_ALIAS': ('TAXJAR_CACHE_ALIAS', 'default'),
+    'CACHE_KEY': ('TAXJAR_CACHE_KEY', 'taxjar_summary_rates'),
+    # Entries of the in-process tier in front of the cache, 0 disables it.
+    'LOCAL_CACHE_MAX_ENTRIES': ('TAXJAR_LOCAL_CACHE_MAX_ENTRIES', 0),
+    'LOCAL_CACHE_TIME': ('TAXJAR_LOCAL_CACHE_TTL', 60),
+    'LOCAL_CACHE_CHECK_INTERVAL': ('TAXJAR_LOCAL_CACHE_CHECK_INTERVAL', 5),
+    'INDIVIDUAL_CACHE_KEY': ('TAXJAR_INDIVIDUAL_CACHE_KEY', 'taxjar_rates'),
+    'CACHE_TIME': ('TAXJAR_CACHE_TTL', 60 * 60),
+    'NEGATIVE_CACHE_TIME': ('TAXJAR_NEGATIVE_CACHE_TTL', 5 * 60),
+    'CACHE_LOCK_TIMEOUT': ('TAXJAR_CACHE_LOCK_TIMEOUT', 10),
+    # Beta of the probabilistic early refresh, 0 disables it.
+    'EARLY_REFRESH_BETA': ('TAXJAR_CACHE_EARLY_REFRESH_BETA', 0),
+    'POOL_SIZE': ('TAXJAR_POOL_SIZE', 10),
+    'CONNECT_TIMEOUT': ('TAXJAR_CONNECT_TIMEOUT', 3.05),
+    'READ_TIMEOUT': ('TAXJAR_READ_TIMEOUT', 10),
+    # Consecutive failed or slow API calls that open the circuit, 0
+    # disables the breaker.
+    'CIRCUIT_FAILURE_THRESHOLD': ('TAXJAR_CIRCUIT_FAILURE_THRESHOLD', 5),
+    'CIRCUIT_RESET_TIMEOUT': ('TAXJAR_CIRCUIT_RESET_TIMEOUT', 30),
+    'LATENCY_BUDGET': ('TAXJAR_LATENCY_BUDGET', 5),
+    # Address rates are kept this long past their TTL as a fallback.
+    'STALE_CACHE_TIME': ('TAXJAR_STALE_CACHE_TTL', 24 * 60 * 60),
+    'ASYNC_POOL_SIZE': ('TAXJAR_ASYNC_POOL_SIZE', 100),
+    'MAX_CONCURRENCY': ('TAXJAR_MAX_CONCURRENCY', 8),
+    'LOCAL_RATES': ('TAXJAR_LOCAL_RATES', False),
+    'LOCAL_RATES_CHECK_INTERVAL': ('TAXJAR_LOCAL_RATES_CHECK_INTERVAL', 60),
+    # Rate table written by the import_tax_rate_table command.
+    'RATE_TABLE_PATH': ('TAXJAR_RATE_TABLE_PATH', None),
+    'CATEGORIES_CACHE_KEY': (
+        'TAXJAR_CATEGORIES_CACHE_KEY', 'taxjar_categories'),
+    'CATEGORIES_CHECK_INTERVAL': ('TAXJAR_CATEGORIES_CHECK_INTERVAL', 60),
+    # Most requested addresses tracked for the cache warmer, 0 disables it.
+    'HOT_ADDRESSES': ('TAXJAR_HOT_ADDRESSES', 0),
+    'HOT_ADDRESSES_FLUSH_INTERVAL': (
+        'TAXJAR_HOT_ADDRESSES_FLUSH_INTERVAL', 60),
+    # Dotted path of an instrumentation.Instrumentation subclass, or None.
+    'INSTRUMENTATION': (
+        'TAXJAR_INSTRUMENTATION',
+        'django_prices_taxjar.instrumentation.SignalInstrumentation'),
+    'TAX_CALLABLE_CACHE_SIZE': ('TAXJAR_TAX_CALLABLE_CACHE_SIZE', 1024),
+    # Product tax codes treated as fully exempt by estimate_taxes_for_order,
+    # 99999 is TaxJar's "Other Exempt" category.
+    'EXEMPT_PRODUCT_TAX_CODES': (
+        'TAXJAR_EXEMPT_PRODUCT_TAX_CODES', ['99999']),
+    # Responses of get_taxes_for_order are cached only with a positive TTL.
+    'ORDER_CACHE_TIME': ('TAXJAR_ORDER_CACHE_TTL', 0),
+    'ORDER_CACHE_MAX_ENTRIES': ('TAXJAR_ORDER_CACHE_MAX_ENTRIES', 1000),
+}
+
+SETTING_NAMES = {setting for setting, _ in DEFAULTS.values()}
+
+
+class TaxJarSettings(object):
+    """
+    Settings of the app, resolved on first access.
+
+    Values are cached until a setting of the app changes, e.g. through
+    override_settings in tests.
+    """
+
+    def __getattr__(self, name):
+        try:
+            setting, default = DEFAULTS[name]
+        except KeyError:
+            raise AttributeError(name)
+        value = getattr(settings, setting, default)
+        if value is REQUIRED:
+            raise ImproperlyConfigured('{} is required'.format(setting))
+        if name == 'EXEMPT_PRODUCT_TAX_CODES':
+            value = frozenset(value)
+        setattr(self, name, value)
+        return value
+
+    @property
+    def RATES_VERSION_CACHE_KEY(self):
+        return self.CACHE_KEY + '_version'
+
+    @property
+    def LOCAL_CACHE_VERSION_CACHE_KEY(self):
+        return self.CACHE_KEY + '_local_version'
+
+    @property
+    def HOT_ADDRESSES_CACHE_KEY(self):
+        return self.INDIVIDUAL_CACHE_KEY + '_hot'
+
+    @property
+    def CATEGORIES_VERSION_CACHE_KEY(self):
+        return self.CATEGORIES_CACHE_KEY + '_version'
+
+    def reload(self):
+        self.__dict__.clear()
+
+
+taxjar_settings = TaxJarSettings()
+
+
+def reload_settings(setting, **kwargs):
+    if setting in SETTING_NAMES:
+        taxjar_settings.reload()
+
+
+setting_changed.connect(reload_settings, dispatch_uid='taxjar_settings')
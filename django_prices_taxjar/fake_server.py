@@ -0,0 +1,410 @@
+"""
+Stand-in TaxJar API for load tests and offline development.
+
+Serves canned responses for summary_rates, categories, rates/{zip} and
+taxes, with configurable latency, server errors and rate limiting.  Run it
+with:
+
+    python -m django_prices_taxjar.fake_server --port 8000 --latency 0.05
+
+and point TAXJAR_API at http://127.0.0.1:8000/v2/.
+"""
+import argparse
+import copy
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+SUMMARY_RATES = {
+    "summary_rates": [
+        {
+            "country_code": "US",
+            "country": "United States",
+            "region_code": "CA",
+            "region": "California",
+            "minimum_rate": {
+                "label": "State Tax",
+                "rate": 0.065
+            },
+            "average_rate": {
+                "label": "Tax",
+                "rate": 0.0827
+            }
+        },
+        {
+            "country_code": "CA",
+            "country": "Canada",
+            "region_code": "BC",
+            "region": "British Columbia",
+            "minimum_rate": {
+                "label": "GST",
+                "rate": 0.05
+            },
+            "average_rate": {
+                "label": "PST",
+                "rate": 0.12
+            }
+        },
+        {
+            "country_code": "UK",
+            "country": "United Kingdom",
+            "region_code": None,
+            "region": None,
+            "minimum_rate": {
+                "label": "VAT",
+                "rate": 0.2
+            },
+            "average_rate": {
+                "label": "VAT",
+                "rate": 0.2
+            }
+        }
+    ]
+}
+
+CATEGORIES = {
+    "categories": [
+        {
+            "name": "Clothing",
+            "product_tax_code": "20010",
+            "description": (
+                " All human wearing apparel suitable for general use")
+        },
+        {
+            "name": "Software as a Service",
+            "product_tax_code": "30070",
+            "description": (
+                "Pre-written software, delivered electronically, but access "
+                "remotely.")
+        },
+        {
+            "name": "Digital Goods",
+            "product_tax_code": "31000",
+            "description": (
+                "Digital products transferred electronically, meaning "
+                "obtained by the purchaser by means other than tangible "
+                "storage media.")
+        },
+        {
+            "name": "Candy",
+            "product_tax_code": "40010",
+            "description": "Candy and similar items"
+        },
+        {
+            "name": "Supplements",
+            "product_tax_code": "40020",
+            "description": "Non-food dietary supplements"
+        },
+        {
+            "name": "Food & Groceries",
+            "product_tax_code": "40030",
+            "description": "Food for humans consumption, unprepared"
+        },
+        {
+            "name": "Soft Drinks",
+            "product_tax_code": "40050",
+            "description": (
+                "Soft drinks, soda, and other similar beverages. Does not "
+                "include fruit juices and water.")
+        },
+        {
+            "name": "Bottled Water",
+            "product_tax_code": "40060",
+            "description": "Bottled, drinkable water for human consumption."
+        },
+        {
+            "name": "Prepared Foods",
+            "product_tax_code": "41000",
+            "description": (
+                "Foods intended for on-site consumption. Ex. Restaurant "
+                "meals.")
+        },
+        {
+            "name": "Non-Prescription",
+            "product_tax_code": "51010",
+            "description": "Drugs for human use without a prescription"
+        },
+        {
+            "name": "Prescription",
+            "product_tax_code": "51020",
+            "description": "Drugs for human use with a prescription"
+        },
+        {
+            "name": "Books",
+            "product_tax_code": "81100",
+            "description": "Books, printed"
+        },
+        {
+            "name": "Textbook",
+            "product_tax_code": "81110",
+            "description": "Textbooks, printed"
+        },
+        {
+            "name": "Religious Books",
+            "product_tax_code": "81120",
+            "description": "Religious books and manuals, printed"
+        },
+        {
+            "name": "Magazines & Subscriptions",
+            "product_tax_code": "81300",
+            "description": "Periodicals, printed, sold by subscription"
+        },
+        {
+            "name": "Magazine",
+            "product_tax_code": "81310",
+            "description": "Periodicals, printed, sold individually"
+        },
+        {
+            "name": "Other Exempt",
+            "product_tax_code": "99999",
+            "description": "Item is exempt"
+        }
+    ]
+}
+
+ADDRESS_RATE = {
+    "rate": {
+        "zip": "05495-2086",
+        "country": "US",
+        "country_rate": "0.0",
+        "state": "VT",
+        "state_rate": "0.06",
+        "county": "CHITTENDEN",
+        "county_rate": "0.0",
+        "city": "WILLISTON",
+        "city_rate": "0.0",
+        "combined_district_rate": "0.01",
+        "combined_rate": "0.07",
+        "freight_taxable": True
+    }
+}
+
+ORDER_TAX = {
+    "tax": {
+        "order_total_amount": 16.5,
+        "shipping": 1.5,
+        "taxable_amount": 15,
+        "amount_to_collect": 1.35,
+        "rate": 0.09,
+        "has_nexus": True,
+        "freight_taxable": False,
+        "tax_source": "destination",
+        "breakdown": {
+            "taxable_amount": 15,
+            "tax_collectable": 1.35,
+            "combined_tax_rate": 0.09,
+            "state_taxable_amount": 15,
+            "state_tax_rate": 0.0625,
+            "state_tax_collectable": 0.94,
+            "county_taxable_amount": 15,
+            "county_tax_rate": 0.0025,
+            "county_tax_collectable": 0.04,
+            "city_taxable_amount": 0,
+            "city_tax_rate": 0,
+            "city_tax_collectable": 0,
+            "special_district_taxable_amount": 15,
+            "special_tax_rate": 0.025,
+            "special_district_tax_collectable": 0.38,
+            "line_items": [
+                {
+                    "id": "1",
+                    "taxable_amount": 15,
+                    "tax_collectable": 1.35,
+                    "combined_tax_rate": 0.09,
+                    "state_taxable_amount": 15,
+                    "state_sales_tax_rate": 0.0625,
+                    "state_amount": 0.94,
+                    "county_taxable_amount": 15,
+                    "county_tax_rate": 0.0025,
+                    "county_amount": 0.04,
+                    "city_taxable_amount": 0,
+                    "city_tax_rate": 0,
+                    "city_amount": 0,
+                    "special_district_taxable_amount": 15,
+                    "special_tax_rate": 0.025,
+                    "special_district_amount": 0.38
+                }
+            ]
+        }
+    }
+}
+
+
+class FakeTaxJarHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, avoid waiting for ACKs.
+    disable_nagle_algorithm = True
+
+    def _send_json(self, status, data, headers=()):
+        body = json.dumps(data).encode('utf-8')
+        # Count before answering, so clients see their request counted.
+        self.server.record(self.path, status)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _fail(self):
+        """Simulate latency and failures, return True if a failure was sent."""
+
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        if not self.headers.get('Authorization'):
+            self._send_json(401, {
+                'status': 401, 'error': 'Unauthorized',
+                'detail': 'Not authorized for route'})
+            return True
+        roll = server.random()
+        if roll < server.rate_limit_rate:
+            self._send_json(429, {
+                'status': 429, 'error': 'Too Many Requests',
+                'detail': 'Rate limit exceeded'}, [('Retry-After', '1')])
+            return True
+        if roll < server.rate_limit_rate + server.error_rate:
+            self._send_json(500, {
+                'status': 500, 'error': 'Internal Server Error',
+                'detail': 'Simulated error'})
+            return True
+        return False
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if self._fail():
+            return
+        if url.path == '/v2/summary_rates':
+            self._send_json(200, self.server.summary_rates)
+        elif url.path == '/v2/categories':
+            self._send_json(200, CATEGORIES)
+        elif url.path.startswith('/v2/rates/'):
+            params = parse_qs(url.query)
+            data = copy.deepcopy(ADDRESS_RATE)
+            data['rate']['zip'] = url.path[len('/v2/rates/'):]
+            for param, field in [('country', 'country'), ('state', 'state'),
+                                 ('city', 'city')]:
+                if param in params:
+                    data['rate'][field] = params[param][0].upper()
+            self._send_json(200, data)
+        else:
+            self._send_json(404, {'status': 404, 'error': 'Not Found'})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        order = self._read_json()
+        if self._fail():
+            return
+        if url.path == '/v2/taxes':
+            data = copy.deepcopy(ORDER_TAX)
+            line_item = data['tax']['breakdown']['line_items'][0]
+            data['tax']['breakdown']['line_items'] = [
+                dict(line_item, id=item.get('id'))
+                for item in order.get('line_items') or [{'id': '1'}]]
+            self._send_json(200, data)
+        else:
+            self._send_json(404, {'status': 404, 'error': 'Not Found'})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeTaxJarServer(ThreadingHTTPServer):
+    """
+    Fake TaxJar API served from a background thread.
+
+    latency is the delay in seconds added to every response, error_rate and
+    rate_limit_rate the fractions of requests answered with a 500 and a 429.
+    summary_rates replaces the summary rates response.  Use it as a context
+    manager, or call start() and stop().  requests counts the responses by
+    (path, status).
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0, error_rate=0,
+                 rate_limit_rate=0, summary_rates=None, seed=None):
+        super().__init__((host, port), FakeTaxJarHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.summary_rates = summary_rates or SUMMARY_RATES
+        self.requests = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        """Value for TAXJAR_API."""
+        host, port = self.server_address[:2]
+        return 'http://{}:{}/v2/'.format(host, port)
+
+    def random(self):
+        with self._lock:
+            return self._random.random()
+
+    def record(self, path, status):
+        path = urlsplit(path).path
+        if path.startswith('/v2/rates/'):
+            path = '/v2/rates/{zip}'
+        with self._lock:
+            self.requests[(path, status)] += 1
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m django_prices_taxjar.fake_server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument(
+        '--latency', type=float, default=0,
+        help='Seconds added to every response')
+    parser.add_argument(
+        '--error-rate', type=float, default=0,
+        help='Fraction of requests answered with a 500')
+    parser.add_argument(
+        '--rate-limit-rate', type=float, default=0,
+        help='Fraction of requests answered with a 429')
+    options = parser.parse_args(argv)
+    server = FakeTaxJarServer(
+        options.host, options.port, latency=options.latency,
+        error_rate=options.error_rate,
+        rate_limit_rate=options.rate_limit_rate)
+    print('Serving a fake TaxJar API at {}'.format(server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+import bisect
+import threading
+from collections import defaultdict
+
+from django.dispatch import Signal
+
+# Sent by SignalInstrumentation, with the arguments of the matching hook.
+api_called = Signal()
+cache_looked_up = Signal()
+db_queried = Signal()
+payload_measured = Signal()
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+class Instrumentation(object):
+    """
+    Hooks called on every API call, cache lookup and database query.
+
+    This base class ignores everything; subclass it and override the hooks
+    you need, then point TAXJAR_INSTRUMENTATION at the subclass.  Hooks are
+    called in the request path, so they should be cheap.
+    """
+
+    def api_call(self, endpoint: str, method: str, status, duration: float):
+        """
+        Called after every API call.
+
+        endpoint is the URL template, e.g. 'rates/{postal_code}', and status
+        is the HTTP status code, or None if the call raised.
+        """
+
+    def cache_lookup(self, cache: str, outcome: str, tier: str='shared',
+                     count: int=1):
+        """
+        Called after count lookups in a cache.
+
+        cache names what was looked up ('address', 'region', 'categories',
+        'order' or 'tiered'), outcome is 'hit', 'miss' or 'stale' (an expired entry),
+        and tier is 'local' for in-process caches or 'shared'.
+        """
+
+    def db_query(self, query: str, duration: float):
+        """Called after reading rates or categories from the database."""
+
+    def payload_size(self, payload: str, size: int):
+        """Called with the size in bytes of a request sent to the API."""
+
+    @property
+    def measures_payload_size(self):
+        """
+        Whether payload_size() records anything.
+
+        Measuring a payload means encoding it, so it is skipped unless this
+        is true.  By default it is true if a subclass overrides the hook.
+        """
+
+        return type(self).payload_size is not Instrumentation.payload_size
+
+
+class SignalInstrumentation(Instrumentation):
+    """Send the hooks as Django signals, the default instrumentation."""
+
+    def api_call(self, endpoint, method, status, duration):
+        api_called.send(
+            sender=self.__class__, endpoint=endpoint, method=method,
+            status=status, duration=duration)
+
+    def cache_lookup(self, cache, outcome, tier='shared', count=1):
+        cache_looked_up.send(
+            sender=self.__class__, cache=cache, outcome=outcome, tier=tier,
+            count=count)
+
+    def db_query(self, query, duration):
+        db_queried.send(sender=self.__class__, query=query, duration=duration)
+
+    def payload_size(self, payload, size):
+        payload_measured.send(
+            sender=self.__class__, payload=payload, size=size)
+
+    @property
+    def measures_payload_size(self):
+        return payload_measured.has_listeners(self.__class__)
+
+
+class Histogram(object):
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+
+def _format_labels(labels):
+    return ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace(
+            '"', '\\"')) for name, value in labels)
+
+
+class MetricsRegistry(Instrumentation):
+    """
+    Keep Prometheus-style metrics of the hooks in memory.
+
+    Metrics are per process.  render() returns them in the Prometheus text
+    format, e.g. for a metrics view, and get_sample_value() reads a single
+    sample.
+    """
+
+    def __init__(self):
+        self._counters = defaultdict(int)
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def _inc(self, name, labels, value=1):
+        with self._lock:
+            self._counters[(name, labels)] += value
+
+    def _observe(self, name, labels, value, buckets):
+        with self._lock:
+            histogram = self._histograms.get((name, labels))
+            if histogram is None:
+                histogram = self._histograms[(name, labels)] = Histogram(
+                    buckets)
+            histogram.observe(value)
+
+    def api_call(self, endpoint, method, status, duration):
+        labels = (('endpoint', endpoint), ('method', method))
+        self._observe('taxjar_api_request_duration_seconds', labels,
+                      duration, LATENCY_BUCKETS)
+        self._inc('taxjar_api_responses_total', labels + (
+            ('status', 'error' if status is None else str(status)),))
+
+    def cache_lookup(self, cache, outcome, tier='shared', count=1):
+        self._inc('taxjar_cache_lookups_total', (
+            ('cache', cache), ('tier', tier), ('outcome', outcome)), count)
+
+    def db_query(self, query, duration):
+        self._observe('taxjar_db_query_duration_seconds',
+                      (('query', query),), duration, LATENCY_BUCKETS)
+
+    def payload_size(self, payload, size):
+        self._observe('taxjar_payload_size_bytes', (('payload', payload),),
+                      size, SIZE_BUCKETS)
+
+    def get_sample_value(self, name, **labels):
+        """
+        Get the value of a sample, or None if it was never recorded.
+
+        Histograms are read through their _count, _sum and _bucket samples,
+        the latter with an le label.
+        """
+
+        for sample_name, sample_labels, value in self.samples():
+            if sample_name == name and dict(sample_labels) == labels:
+                return value
+        return None
+
+    def samples(self):
+        """Yield (name, labels, value) for every sample."""
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, (histogram.sum, histogram.count,
+                       list(histogram.cumulative_counts())))
+                for key, histogram in self._histograms.items())
+        for (name, labels), value in counters:
+            yield name, labels, value
+        for (name, labels), (total, count, buckets) in histograms:
+            for bound, cumulative in buckets:
+                le = '+Inf' if bound == float('inf') else str(bound)
+                yield name + '_bucket', labels + (('le', le),), cumulative
+            yield name + '_sum', labels, total
+            yield name + '_count', labels, count
+
+    def render(self):
+        """Render the metrics in the Prometheus text exposition format."""
+
+        lines = []
+        for name, labels, value in self.samples():
+            if labels:
+                lines.append('{}{{{}}} {}'.format(
+                    name, _format_labels(labels), value))
+            else:
+                lines.append('{} {}'.format(name, value))
+        return '\n'.join(lines) + '\n'
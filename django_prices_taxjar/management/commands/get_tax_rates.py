@@ -1,14 +1,66 @@
+from concurrent.futures import ThreadPoolExecutor
+
 from django.core.management.base import BaseCommand
+from django.db import transaction
 
 from ... import utils
 
 
+def fetch_categories():
+    json_response_types = utils.fetch_categories()
+    utils.validate_data(json_response_types)
+    return json_response_types
+
+
 class Command(BaseCommand):
     help = 'Get current tax rates in regions and saves to database'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=100,
+            help='Number of tax rates written to the database at once')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Fetch and compare the tax rates without saving them')
+        parser.add_argument(
+            '--retries', type=int, default=3,
+            help='Number of times a failed API call is retried')
+        parser.add_argument(
+            '--backoff', type=float, default=0.5,
+            help='Seconds to wait before the first retry, doubled after '
+                 'every further failure')
+
     def handle(self, *args, **options):
-        json_response_rates = utils.fetch_tax_rates()
-        utils.create_objects_from_json(json_response_rates)
+        dry_run = options['dry_run']
+        retries = options['retries']
+        backoff = options['backoff']
+
+        def progress(stats):
+            self.stdout.write('Processed {} tax rates'.format(
+                stats['added'] + stats['changed'] + stats['unchanged']))
+
+        def refresh():
+            # A failed attempt only rolls back its own savepoint.
+            with transaction.atomic():
+                return utils.refresh_tax_rates(
+                    utils.stream_tax_rates(),
+                    chunk_size=options['chunk_size'], dry_run=dry_run,
+                    progress=progress)
+
+        # Categories are fetched while the rates stream into the database,
+        # and nothing is committed unless both succeeded.
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            categories = executor.submit(
+                utils.call_with_retries, fetch_categories, retries, backoff)
+            with transaction.atomic():
+                stats = utils.call_with_retries(refresh, retries, backoff)
+                json_response_types = categories.result()
+                if not dry_run:
+                    utils.save_tax_categories(json_response_types)
 
-        json_response_types = utils.fetch_categories()
-        utils.save_tax_categories(json_response_types)
+        self.stdout.write(self.style.SUCCESS(
+            '{}: {} added, {} changed, {} removed, {} unchanged tax rates '
+            'and {} categories'.format(
+                'Dry run' if dry_run else 'Done', stats['added'],
+                stats['changed'], stats['removed'], stats['unchanged'],
+                len(json_response_types['categories']))))
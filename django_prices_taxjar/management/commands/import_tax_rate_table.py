@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...conf import taxjar_settings
+from ...rate_table import read_rows, write_rate_table
+
+
+class Command(BaseCommand):
+    help = 'Import postal code tax rates from a CSV or JSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'source', help='CSV or JSON file with a row per postal code')
+        parser.add_argument(
+            '--output',
+            help='Path of the rate table, defaults to TAXJAR_RATE_TABLE_PATH')
+
+    def handle(self, *args, **options):
+        output = options['output'] or taxjar_settings.RATE_TABLE_PATH
+        if not output:
+            raise CommandError(
+                'Pass --output or set TAXJAR_RATE_TABLE_PATH')
+        try:
+            count = write_rate_table(output, read_rows(options['source']))
+        except (OSError, KeyError, ValueError) as error:
+            raise CommandError(str(error))
+        self.stdout.write(self.style.SUCCESS(
+            'Done: {} postal code rates written to {}'.format(count, output)))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from ... import utils
+
+
+class Command(BaseCommand):
+    help = 'Load region rates and the most requested addresses into the cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int,
+            help='Number of most requested addresses to warm')
+        parser.add_argument(
+            '--ahead', type=float,
+            help='Refresh addresses expiring within this many seconds, '
+                 'defaults to a tenth of TAXJAR_CACHE_TTL')
+        parser.add_argument(
+            '--concurrency', type=int,
+            help='Number of addresses fetched at once, defaults to '
+                 'TAXJAR_MAX_CONCURRENCY')
+
+    def handle(self, *args, **options):
+        stats = utils.warm_cache(
+            limit=options['limit'], ahead=options['ahead'],
+            max_workers=options['concurrency'])
+        if stats['failed']:
+            self.stderr.write(self.style.WARNING(
+                '{} addresses failed to refresh'.format(stats['failed'])))
+        self.stdout.write(self.style.SUCCESS(
+            'Done: {} regions and {} addresses warmed'.format(
+                stats['regions'], stats['addresses'])))
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-17 18:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_prices_taxjar', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tax',
+            name='data_hash',
+            field=models.CharField(blank=True, default='', max_length=40, verbose_name='data hash'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def get_decimal_rate(data, rate_key):
+    try:
+        return Decimal(str(data[rate_key]['rate']))
+    except (KeyError, TypeError):
+        return None
+
+
+def fill_rate_columns(apps, schema_editor):
+    Tax = apps.get_model('django_prices_taxjar', 'Tax')
+    seen = set()
+    duplicates = []
+    for tax in Tax.objects.order_by('-pk'):
+        key = (tax.country_code, tax.region_code)
+        if key in seen:
+            duplicates.append(tax.pk)
+            continue
+        seen.add(key)
+        tax.average_rate = get_decimal_rate(tax.data, 'average_rate')
+        tax.minimum_rate = get_decimal_rate(tax.data, 'minimum_rate')
+        tax.save(update_fields=['average_rate', 'minimum_rate'])
+    Tax.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_prices_taxjar', '0002_tax_data_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tax',
+            name='average_rate',
+            field=models.DecimalField(blank=True, db_index=True, decimal_places=6, max_digits=9, null=True, verbose_name='average rate'),
+        ),
+        migrations.AddField(
+            model_name='tax',
+            name='minimum_rate',
+            field=models.DecimalField(blank=True, db_index=True, decimal_places=6, max_digits=9, null=True, verbose_name='minimum rate'),
+        ),
+        migrations.RunPython(fill_rate_columns, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='tax',
+            unique_together={('country_code', 'region_code')},
+        ),
+    ]
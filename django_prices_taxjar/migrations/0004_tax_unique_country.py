@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-17 18:40
+
+from django.db import migrations, models
+
+
+def delete_duplicate_countries(apps, schema_editor):
+    Tax = apps.get_model('django_prices_taxjar', 'Tax')
+    seen = set()
+    duplicates = []
+    for tax in Tax.objects.filter(region_code__isnull=True).order_by('-pk'):
+        if tax.country_code in seen:
+            duplicates.append(tax.pk)
+        seen.add(tax.country_code)
+    Tax.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_prices_taxjar', '0003_tax_rate_columns'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            delete_duplicate_countries, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='tax',
+            constraint=models.UniqueConstraint(condition=models.Q(('region_code__isnull', True)), fields=('country_code',), name='django_prices_taxjar_tax_unique_country'),
+        ),
+    ]
@@ -13,7 +13,26 @@ class Tax(models.Model):
     region_code = models.CharField(
         pgettext_lazy('Tax field', 'region code'), max_length=2, db_index=True,
         blank=True, null=True)
+    average_rate = models.DecimalField(
+        pgettext_lazy('Tax field', 'average rate'), max_digits=9,
+        decimal_places=6, db_index=True, blank=True, null=True)
+    minimum_rate = models.DecimalField(
+        pgettext_lazy('Tax field', 'minimum rate'), max_digits=9,
+        decimal_places=6, db_index=True, blank=True, null=True)
     data = JSONField(pgettext_lazy('Tax field', 'data'))
+    data_hash = models.CharField(
+        pgettext_lazy('Tax field', 'data hash'), max_length=40, blank=True,
+        default='')
+
+    class Meta:
+        unique_together = [('country_code', 'region_code')]
+        # NULLs are distinct in unique_together, so cover rows without a
+        # region separately.
+        constraints = [
+            models.UniqueConstraint(
+                fields=['country_code'],
+                condition=models.Q(region_code__isnull=True),
+                name='django_prices_taxjar_tax_unique_country')]
 
     def __str__(self):
         return self.country_code
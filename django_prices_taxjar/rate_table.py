@@ -0,0 +1,186 @@
+import csv
+import json
+import mmap
+import os
+import struct
+from decimal import Decimal, InvalidOperation
+
+MAGIC = b'TJRT'
+VERSION = 1
+
+HEADER = struct.Struct('<4sHI')
+# Country, postal code, state, rates in millionths and freight_taxable.
+RECORD = struct.Struct('<2s10s2s6IB')
+KEY_SIZE = 12
+
+RATE_FIELDS = (
+    'country_rate', 'state_rate', 'county_rate', 'city_rate',
+    'combined_district_rate', 'combined_rate')
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't'}
+
+
+def normalize_postal_code(postal_code):
+    return ''.join(str(postal_code).split()).upper()
+
+
+def _encode_rate(value):
+    if value is None or value == '':
+        return 0
+    try:
+        return int(Decimal(str(value)).scaleb(6).to_integral_value())
+    except InvalidOperation:
+        raise ValueError('Invalid rate {!r}'.format(value))
+
+
+def _decode_rate(value):
+    return str(Decimal(value).scaleb(-6).normalize())
+
+
+def _encode_text(value, size, name):
+    encoded = (value or '').encode('ascii')
+    if len(encoded) > size:
+        raise ValueError('{} {!r} is longer than {} characters'.format(
+            name, value, size))
+    return encoded
+
+
+def _is_true(value):
+    if isinstance(value, str):
+        return value.strip().lower() in TRUE_VALUES
+    return bool(value)
+
+
+def pack_record(row):
+    """Pack a row of the source table into a binary record."""
+
+    postal_code = normalize_postal_code(
+        row.get('zip') or row.get('postal_code') or '')
+    if not postal_code:
+        raise ValueError('Row {!r} has no postal code'.format(row))
+    if row.get('combined_rate') in (None, ''):
+        raise ValueError('Row {!r} has no combined_rate'.format(row))
+    country_code = (row.get('country') or 'US').upper()
+    region_code = (row.get('state') or '').upper()
+    return RECORD.pack(
+        _encode_text(country_code, 2, 'Country code'),
+        _encode_text(postal_code, 10, 'Postal code'),
+        _encode_text(region_code, 2, 'State'),
+        *[_encode_rate(row.get(field)) for field in RATE_FIELDS],
+        _is_true(row.get('freight_taxable')))
+
+
+def unpack_record(record):
+    """Unpack a binary record into a rate dict shaped like TaxJar's."""
+
+    country_code, postal_code, region_code, *rates, freight_taxable = \
+        RECORD.unpack(record)
+    data = {
+        'zip': postal_code.rstrip(b'\0').decode('ascii'),
+        'country': country_code.rstrip(b'\0').decode('ascii')}
+    region_code = region_code.rstrip(b'\0').decode('ascii')
+    if region_code:
+        data['state'] = region_code
+    for field, rate in zip(RATE_FIELDS, rates):
+        data[field] = _decode_rate(rate)
+    data['freight_taxable'] = bool(freight_taxable)
+    return data
+
+
+def read_rows(path):
+    """
+    Read the rows of a source table.
+
+    Files ending with .json hold a list of rows or an object with a rates
+    list, other files are read as CSV with a header line.
+    """
+
+    with open(path, newline='', encoding='utf-8') as source:
+        if path.endswith('.json'):
+            data = json.load(source)
+            if isinstance(data, dict):
+                data = data['rates']
+            return list(data)
+        return list(csv.DictReader(source))
+
+
+def write_rate_table(path, rows):
+    """
+    Write rows to a rate table file and return the number of records.
+
+    The file is written next to path and moved in place, so processes
+    reading the old table never see a partial one.
+    """
+
+    records = sorted(pack_record(row) for row in rows)
+    for previous, record in zip(records, records[1:]):
+        if previous[:KEY_SIZE] == record[:KEY_SIZE]:
+            raise ValueError('Duplicate postal code {!r}'.format(
+                unpack_record(record)['zip']))
+    temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temporary_path, 'wb') as output:
+        output.write(HEADER.pack(MAGIC, VERSION, len(records)))
+        output.writelines(records)
+    os.replace(temporary_path, path)
+    return len(records)
+
+
+class RateTable(object):
+    """
+    Read-only, memory-mapped rate table.
+
+    The file holds a header followed by fixed-size records sorted by country
+    and postal code, so lookups are a binary search over the map and never
+    touch the network or the database.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as table_file:
+            self._map = mmap.mmap(
+                table_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self._count = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('{} is not a rate table'.format(path))
+        if len(self._map) != HEADER.size + self._count * RECORD.size:
+            raise ValueError('{} is truncated'.format(path))
+
+    def __len__(self):
+        return self._count
+
+    def _find(self, key):
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            offset = HEADER.size + middle * RECORD.size
+            current = self._map[offset:offset + KEY_SIZE]
+            if current < key:
+                low = middle + 1
+            elif current > key:
+                high = middle
+            else:
+                return self._map[offset:offset + RECORD.size]
+        return None
+
+    def get(self, postal_code: str, country_code: str=None):
+        """
+        Get the rates of a postal code, or None if it is not in the table.
+
+        ZIP+4 codes fall back to their five digit ZIP code.
+        """
+
+        postal_code = normalize_postal_code(postal_code)
+        country = (country_code or 'US').upper().encode('ascii', 'replace')
+        candidates = [postal_code]
+        if '-' in postal_code:
+            candidates.append(postal_code.split('-', 1)[0])
+        for candidate in candidates:
+            encoded = candidate.encode('ascii', 'replace')
+            if len(encoded) > 10 or len(country) != 2:
+                continue
+            record = self._find(country + encoded.ljust(10, b'\0'))
+            if record is not None:
+                return unpack_record(record)
+        return None
+
+    def close(self):
+        self._map.close()
@@ -1,36 +1,209 @@
+import asyncio
+import codecs
+import email.utils
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+import weakref
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from decimal import Decimal
+from types import MappingProxyType
 
-from typing import Iterable
+from typing import Iterable, Mapping
 
-import requests
-from django.conf import settings
-from django.core.cache import cache
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache
+from django.core.signals import (
+    request_finished, request_started, setting_changed)
 from django.core.exceptions import ImproperlyConfigured, ObjectDoesNotExist
-from prices import flat_tax, Money
-
-from . import LineItem, tax_amount
-
-from .models import Tax, TaxCategories, DEFAULT_TYPES_INSTANCE_ID
+from django.db import transaction
+from django.utils.module_loading import import_string
+from prices import Money
 
 try:
-    ACCESS_KEY = settings.TAXJAR_ACCESS_KEY
-except AttributeError:
-    raise ImproperlyConfigured('TAXJAR_ACCESS_KEY is required')
+    from asgiref.sync import sync_to_async
+except ImportError:  # Django < 3.0
+    sync_to_async = None
 
-DEFAULT_URL = 'https://api.taxjar.com/v2/'
+from . import AmountTax, FlatTax, LineItem, LineItemBatch
+from .breaker import CLOSED, CircuitBreaker, CircuitOpenError
 
-TAXJAR_API = getattr(settings, 'TAXJAR_API', DEFAULT_URL)
+from .caching import (
+    FrequencySketch, LocalCache, TieredCache, VersionedValue, lazy_lru_cache)
+from .conf import DEFAULTS, SETTING_NAMES, taxjar_settings
+from .instrumentation import Instrumentation
+from .models import Tax, TaxCategories, DEFAULT_TYPES_INSTANCE_ID
+from .rate_table import RateTable
 
 RATES_URL = 'summary_rates'
 TYPES_URL = 'categories'
 RATES_LOCATION_URL = 'rates/{postal_code}'
 ORDER_TAXES_URL = 'taxes'
 
-CACHE_KEY = getattr(
-    settings, 'TAXJAR_CACHE_KEY', 'taxjar_summary_rates')
-INDIVIDUAL_CACHE_KEY = getattr(
-    settings, 'TAXJAR_INDIVIDUAL_CACHE_KEY', 'taxjar_rates')
-CACHE_TIME = getattr(settings, 'TAXJAR_CACHE_TTL', 60 * 60)
+CACHE_LOCK_POLL_INTERVAL = 0.05
+
+# Cached in place of a missing value, so unknown keys are not looked up
+# again until the negative TTL runs out.
+NOT_FOUND = '__taxjar_not_found__'
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+_async_clients = weakref.WeakKeyDictionary()
+
+# Keeps background revalidation tasks alive until they finish.
+_background_tasks = set()
+
+CacheEntry = namedtuple('CacheEntry', ['value', 'expires', 'delta'])
+
+RegionRates = namedtuple(
+    'RegionRates', ['average_rate', 'minimum_rate', 'data'])
+
+TaxCategoryIndex = namedtuple('TaxCategoryIndex', ['categories', 'by_code'])
+
+ADDRESS_FIELDS = (
+    'postal_code', 'country_code', 'region_code', 'city', 'street')
+
+AddressRates = namedtuple(
+    'AddressRates', ['combined_rate', 'freight_taxable', 'components', 'data'])
+
+_request_memo = threading.local()
+
+# Created on first use from the settings, see _reset_local_state.
+_order_cache = None
+_instrumentation = None
+_hot_addresses = None
+_hot_addresses_flushed = None
+_circuit_breaker = None
+_tiered_cache = None
+_rate_table = None
+_rates_index = None
+_tax_category_index = None
+
+
+def __getattr__(name):
+    # Settings used to be read into module constants at import time.
+    if name in DEFAULTS or name in (
+            'RATES_VERSION_CACHE_KEY', 'CATEGORIES_VERSION_CACHE_KEY',
+            'LOCAL_CACHE_VERSION_CACHE_KEY', 'HOT_ADDRESSES_CACHE_KEY'):
+        return getattr(taxjar_settings, name)
+    raise AttributeError(
+        'module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+def get_instrumentation():
+    """
+    Get the instrumentation configured by TAXJAR_INSTRUMENTATION.
+
+    With the setting set to None, a no-op Instrumentation is returned.
+    """
+
+    global _instrumentation
+
+    if _instrumentation is None:
+        path = taxjar_settings.INSTRUMENTATION
+        _instrumentation = import_string(path)() if path else \
+            Instrumentation()
+    return _instrumentation
+
+
+def _record_tiered_lookup(tier, outcome, count):
+    get_instrumentation().cache_lookup('tiered', outcome, tier, count)
+
+
+def get_shared_cache():
+    """Get the cache backend configured by TAXJAR_CACHE_ALIAS."""
+
+    return caches[taxjar_settings.CACHE_ALIAS]
+
+
+def get_cache():
+    """
+    Get the cache used for rates and categories.
+
+    With TAXJAR_LOCAL_CACHE_MAX_ENTRIES set, this is a TieredCache keeping
+    hot entries in process in front of the shared cache.
+    """
+
+    global _tiered_cache
+
+    if not taxjar_settings.LOCAL_CACHE_MAX_ENTRIES:
+        return get_shared_cache()
+    if _tiered_cache is None:
+        _tiered_cache = TieredCache(
+            get_shared_cache(),
+            LocalCache(taxjar_settings.LOCAL_CACHE_MAX_ENTRIES,
+                       taxjar_settings.LOCAL_CACHE_TIME),
+            taxjar_settings.LOCAL_CACHE_VERSION_CACHE_KEY,
+            taxjar_settings.LOCAL_CACHE_CHECK_INTERVAL,
+            listener=_record_tiered_lookup)
+    return _tiered_cache
+
+
+def get_cache_stats():
+    """
+    Get the hit and miss counters of the cache tiers.
+
+    Returns an empty Counter when the in-process tier is disabled.
+    """
+
+    cache = get_cache()
+    if isinstance(cache, TieredCache):
+        return Counter(cache.stats)
+    return Counter()
+
+
+def invalidate_local_cache():
+    """Make every process drop its in-process cache tier."""
+
+    cache = get_cache()
+    if isinstance(cache, TieredCache):
+        cache.invalidate()
+
+
+class APIUnavailableError(ImproperlyConfigured):
+    """
+    Raised for 429 and 5xx responses, which are worth retrying.
+
+    retry_after holds the seconds asked for by a Retry-After header, or
+    None.
+    """
+
+    def __init__(self, status, retry_after=None):
+        super().__init__('TaxJar responded with status {}'.format(status))
+        self.status = status
+        self.retry_after = retry_after
+
+
+def _get_retry_after(response):
+    value = getattr(response, 'headers', {}).get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0)
+
+
+def _check_response(response):
+    if _is_server_error(response):
+        response.close()
+        raise APIUnavailableError(
+            response.status_code, _get_retry_after(response))
 
 
 def validate_data(json_data):
@@ -39,36 +212,490 @@ def validate_data(json_data):
         raise ImproperlyConfigured(info)
 
 
-def fetch_from_api(url, method, **kwargs):
-    url = TAXJAR_API + url
-    headers = {
-        'Authorization': 'Token token="{}"'.format(ACCESS_KEY)
-    }
-    response = method(
-        url, headers=headers, **kwargs)
+def create_session():
+    """Create a keep-alive session with a connection pool for the API."""
+
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=1, pool_maxsize=taxjar_settings.POOL_SIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['Authorization'] = 'Token token="{}"'.format(
+        taxjar_settings.ACCESS_KEY)
+    return session
+
+
+def get_session():
+    """
+    Get the session shared by all API calls in this process.
+
+    The session is created lazily and recreated after a fork, so pooled
+    connections are never shared between processes.
+    """
+
+    global _session, _session_pid
+
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                _session = create_session()
+                _session_pid = pid
+    return _session
+
+
+def set_session(session):
+    """
+    Replace the shared session, e.g. with a stub in tests.
+
+    Passing None drops the current session so a new one is created on the
+    next API call.
+    """
+
+    global _session, _session_pid
+
+    with _session_lock:
+        _session = session
+        _session_pid = os.getpid() if session is not None else None
+
+
+def _get_timeout():
+    return (taxjar_settings.CONNECT_TIMEOUT, taxjar_settings.READ_TIMEOUT)
+
+
+def get_circuit_breaker():
+    """Get the circuit breaker guarding API calls in this process."""
+
+    global _circuit_breaker
+
+    if _circuit_breaker is None:
+        _circuit_breaker = CircuitBreaker(
+            taxjar_settings.CIRCUIT_FAILURE_THRESHOLD,
+            taxjar_settings.CIRCUIT_RESET_TIMEOUT,
+            taxjar_settings.LATENCY_BUDGET)
+    return _circuit_breaker
+
+
+def _is_server_error(response):
+    status_code = getattr(response, 'status_code', 200)
+    return status_code >= 500 or status_code == 429
+
+
+def _record_api_call(endpoint, method, response, started):
+    duration = time.monotonic() - started
+    status = None if response is None else getattr(
+        response, 'status_code', 200)
+    get_instrumentation().api_call(endpoint, method, status, duration)
+    breaker = get_circuit_breaker()
+    if response is None or _is_server_error(response):
+        breaker.record_failure()
+    else:
+        breaker.record_success(duration)
+
+
+def _get_method_name(method):
+    # Older callers pass requests functions, e.g. requests.get.
+    return method if isinstance(method, str) else method.__name__
+
+
+def _request(url, method='get', endpoint=None, **kwargs):
+    """
+    Send a request to the API through the circuit breaker.
+
+    The call is reported to the instrumentation and the breaker once the
+    response arrives; with stream=True that is before the body is read.
+    429 and 5xx responses raise APIUnavailableError.
+    """
+
+    if not get_circuit_breaker().allow():
+        raise CircuitOpenError(url)
+    method = _get_method_name(method)
+    endpoint = endpoint or url
+    url = taxjar_settings.TAXJAR_API + url
+    kwargs.setdefault('timeout', _get_timeout())
+    started = time.monotonic()
+    try:
+        response = get_session().request(method, url, **kwargs)
+    except Exception:
+        _record_api_call(endpoint, method, None, started)
+        raise
+    _record_api_call(endpoint, method, response, started)
+    _check_response(response)
+    return response
+
+
+def fetch_from_api(url, method='get', endpoint=None, **kwargs):
+    """
+    Call the API and return the decoded response.
+
+    method is an HTTP method name such as 'get', or a requests function
+    such as requests.get.  endpoint names the call in metrics, it defaults
+    to url.
+    """
+
+    return _request(url, method, endpoint, **kwargs).json()
+
+
+def create_async_client():
+    """Create a pooled async HTTP client for the API."""
+
+    try:
+        import httpx
+    except ImportError:
+        raise ImproperlyConfigured(
+            'httpx is required for the async API, install it with '
+            '"pip install django-prices-taxjar[async]"')
+    pool_size = taxjar_settings.ASYNC_POOL_SIZE
+    return httpx.AsyncClient(
+        headers={'Authorization': 'Token token="{}"'.format(
+            taxjar_settings.ACCESS_KEY)},
+        timeout=httpx.Timeout(taxjar_settings.READ_TIMEOUT,
+                              connect=taxjar_settings.CONNECT_TIMEOUT),
+        limits=httpx.Limits(max_connections=pool_size,
+                            max_keepalive_connections=pool_size))
+
+
+def get_async_client():
+    """
+    Get the async client shared by all API calls on the running event loop.
+
+    Async clients are bound to the loop they were created on, so there is one
+    client per loop.
+    """
+
+    loop = asyncio.get_event_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = create_async_client()
+    return client
+
+
+def set_async_client(client):
+    """
+    Replace the async client of the running event loop, e.g. in tests.
+
+    Passing None drops the current client so a new one is created on the
+    next API call.
+    """
+
+    loop = asyncio.get_event_loop()
+    if client is None:
+        _async_clients.pop(loop, None)
+    else:
+        _async_clients[loop] = client
+
+
+async def afetch_from_api(url, method='get', endpoint=None, **kwargs):
+    if not get_circuit_breaker().allow():
+        raise CircuitOpenError(url)
+    method = _get_method_name(method)
+    endpoint = endpoint or url
+    url = taxjar_settings.TAXJAR_API + url
+    started = time.monotonic()
+    try:
+        response = await get_async_client().request(method, url, **kwargs)
+    except Exception:
+        _record_api_call(endpoint, method, None, started)
+        raise
+    _record_api_call(endpoint, method, response, started)
+    if _is_server_error(response):
+        await response.aclose()
+        raise APIUnavailableError(
+            response.status_code, _get_retry_after(response))
     return response.json()
 
 
+async def afetch_tax_for_address(postal_code, address_data):
+    data = await afetch_from_api(
+        RATES_LOCATION_URL.format(postal_code=postal_code),
+        endpoint=RATES_LOCATION_URL, params=address_data)
+    validate_data(data)
+    return data
+
+
+def _sync_to_async(function, thread_sensitive=True):
+    if sync_to_async is None:
+        raise ImproperlyConfigured(
+            'asgiref is required for the async API, install it with '
+            '"pip install django-prices-taxjar[async]"')
+    return sync_to_async(function, thread_sensitive=thread_sensitive)
+
+
+async def afetch_tax_for_order(order_data):
+    data = await afetch_from_api(
+        ORDER_TAXES_URL, 'post', json=order_data)
+    validate_data(data)
+    return data
+
+
+def _has_native_async(cache, name):
+    # Django's BaseCache async methods run the blocking ones on a single
+    # shared thread, so only use methods a backend implements itself.
+    method = getattr(type(cache), name, None)
+    return method is not None and method is not getattr(BaseCache, name, None)
+
+
+async def _acache_get(key):
+    cache = get_cache()
+    if _has_native_async(cache, 'aget'):
+        return await cache.aget(key)
+    return await _sync_to_async(
+        cache.get, thread_sensitive=False)(key)
+
+
+async def _acache_set(key, value, timeout):
+    cache = get_cache()
+    if _has_native_async(cache, 'aset'):
+        return await cache.aset(key, value, timeout)
+    return await _sync_to_async(
+        cache.set, thread_sensitive=False)(key, value, timeout)
+
+
+async def _acache_add(key, value, timeout):
+    cache = get_cache()
+    if _has_native_async(cache, 'aadd'):
+        return await cache.aadd(key, value, timeout)
+    return await _sync_to_async(
+        cache.add, thread_sensitive=False)(key, value, timeout)
+
+
+async def _acache_delete(key):
+    cache = get_cache()
+    if _has_native_async(cache, 'adelete'):
+        return await cache.adelete(key)
+    return await _sync_to_async(
+        cache.delete, thread_sensitive=False)(key)
+
+
+def _is_cache_entry_fresh(entry):
+    """
+    Tell whether a cached entry can be served without a refresh.
+
+    With a non-zero TAXJAR_CACHE_EARLY_REFRESH_BETA, entries are refreshed
+    early with a probability that grows as they approach expiry and with the
+    time their last refresh took, so a single worker refreshes a hot key
+    before it expires for everyone.
+    """
+
+    if not isinstance(entry, CacheEntry):
+        return False
+    remaining = entry.expires - time.time()
+    beta = taxjar_settings.EARLY_REFRESH_BETA
+    if beta:
+        remaining += entry.delta * beta * math.log(1 - random.random())
+    return remaining > 0
+
+
+def _make_cache_entry(value, delta):
+    return CacheEntry(value, time.time() + taxjar_settings.CACHE_TIME, delta)
+
+
+def _get_entry_timeout():
+    # Entries outlive their TTL so they can be served while TaxJar is down.
+    return taxjar_settings.CACHE_TIME + taxjar_settings.STALE_CACHE_TIME
+
+
+def _is_revalidation_due(entry, force_refresh):
+    return (isinstance(entry, CacheEntry) and not force_refresh and
+            get_circuit_breaker().state != CLOSED)
+
+
+def _refresh_entry(key, refresh):
+    started = time.monotonic()
+    value = refresh()
+    delta = time.monotonic() - started
+    get_cache().set(key, _make_cache_entry(value, delta),
+                    _get_entry_timeout())
+    return value
+
+
+def _revalidate(key, lock_key, refresh):
+    try:
+        _refresh_entry(key, refresh)
+    except Exception:
+        # The breaker has recorded the failure, the stale copy stays.
+        pass
+    finally:
+        get_cache().delete(lock_key)
+
+
+def _is_fetch_error(error):
+    """Whether error means the API could not be reached or answered."""
+
+    # requests' exceptions are OSErrors, undecodable bodies ValueErrors and
+    # error responses raise ImproperlyConfigured in validate_data.
+    if isinstance(error, (OSError, ValueError, ImproperlyConfigured,
+                          CircuitOpenError)):
+        return True
+    httpx = sys.modules.get('httpx')
+    return httpx is not None and isinstance(error, httpx.HTTPError)
+
+
+def _record_cache_lookup(name, entry, fresh):
+    if fresh:
+        outcome = 'hit'
+    elif isinstance(entry, CacheEntry):
+        outcome = 'stale'
+    else:
+        outcome = 'miss'
+    get_instrumentation().cache_lookup(name, outcome)
+
+
+def _get_or_refresh(key, refresh, force_refresh=False, name='address'):
+    """
+    Get a cached value, or refresh it with only one worker at a time.
+
+    The worker holding the key's lock calls refresh(); concurrent workers
+    keep serving the previous value or wait for the new one until the lock
+    times out.
+
+    While the circuit breaker is not closed, expired values are served as
+    they are and refreshed by a background probe once the breaker lets one
+    through.  A refresh that fails, or is rejected by the open circuit, falls
+    back to the expired value too.
+
+    Lookups are reported to the instrumentation as hits, misses or stale
+    hits of the name cache.
+    """
+
+    entry = get_cache().get(key)
+    if not force_refresh:
+        fresh = _is_cache_entry_fresh(entry)
+        _record_cache_lookup(name, entry, fresh)
+        if fresh:
+            return entry.value
+
+    lock_key = key + ':lock'
+    if _is_revalidation_due(entry, force_refresh):
+        if get_circuit_breaker().is_probe_due() and get_cache().add(
+                lock_key, 1, taxjar_settings.CACHE_LOCK_TIMEOUT):
+            threading.Thread(
+                target=_revalidate, args=(key, lock_key, refresh),
+                daemon=True).start()
+        return entry.value
+
+    locked = get_cache().add(
+        lock_key, 1, taxjar_settings.CACHE_LOCK_TIMEOUT)
+    if not locked:
+        if isinstance(entry, CacheEntry) and not force_refresh:
+            return entry.value
+        deadline = time.monotonic() + taxjar_settings.CACHE_LOCK_TIMEOUT
+        while not locked and time.monotonic() < deadline:
+            time.sleep(CACHE_LOCK_POLL_INTERVAL)
+            entry = get_cache().get(key)
+            if isinstance(entry, CacheEntry):
+                return entry.value
+            # The holder released the lock without storing a value, e.g.
+            # because its refresh failed; take over instead of waiting.
+            if get_cache().get(lock_key) is None:
+                locked = get_cache().add(
+                    lock_key, 1, taxjar_settings.CACHE_LOCK_TIMEOUT)
+    try:
+        return _refresh_entry(key, refresh)
+    except Exception as error:
+        if isinstance(entry, CacheEntry) and _is_fetch_error(error):
+            return entry.value
+        raise
+    finally:
+        if locked:
+            get_cache().delete(lock_key)
+
+
+async def _arefresh_entry(key, refresh):
+    started = time.monotonic()
+    value = await refresh()
+    delta = time.monotonic() - started
+    await _acache_set(key, _make_cache_entry(value, delta),
+                      _get_entry_timeout())
+    return value
+
+
+async def _arevalidate(key, lock_key, refresh):
+    try:
+        await _arefresh_entry(key, refresh)
+    except Exception:
+        pass
+    finally:
+        await _acache_delete(lock_key)
+
+
+async def _aget_or_refresh(key, refresh, force_refresh=False,
+                           name='address'):
+    """Async version of _get_or_refresh, refresh is a coroutine function."""
+
+    entry = await _acache_get(key)
+    if not force_refresh:
+        fresh = _is_cache_entry_fresh(entry)
+        _record_cache_lookup(name, entry, fresh)
+        if fresh:
+            return entry.value
+
+    lock_key = key + ':lock'
+    if _is_revalidation_due(entry, force_refresh):
+        if get_circuit_breaker().is_probe_due() and await _acache_add(
+                lock_key, 1, taxjar_settings.CACHE_LOCK_TIMEOUT):
+            task = asyncio.ensure_future(
+                _arevalidate(key, lock_key, refresh))
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+        return entry.value
+
+    locked = await _acache_add(
+        lock_key, 1, taxjar_settings.CACHE_LOCK_TIMEOUT)
+    if not locked:
+        if isinstance(entry, CacheEntry) and not force_refresh:
+            return entry.value
+        deadline = time.monotonic() + taxjar_settings.CACHE_LOCK_TIMEOUT
+        while not locked and time.monotonic() < deadline:
+            await asyncio.sleep(CACHE_LOCK_POLL_INTERVAL)
+            entry = await _acache_get(key)
+            if isinstance(entry, CacheEntry):
+                return entry.value
+            if await _acache_get(lock_key) is None:
+                locked = await _acache_add(
+                    lock_key, 1, taxjar_settings.CACHE_LOCK_TIMEOUT)
+    try:
+        return await _arefresh_entry(key, refresh)
+    except Exception as error:
+        if isinstance(entry, CacheEntry) and _is_fetch_error(error):
+            return entry.value
+        raise
+    finally:
+        if locked:
+            await _acache_delete(lock_key)
+
+
 def fetch_categories():
-    return fetch_from_api(TYPES_URL, requests.get)
+    return fetch_from_api(TYPES_URL)
 
 
 def fetch_tax_rates():
-    return fetch_from_api(RATES_URL, requests.get)
+    return fetch_from_api(RATES_URL)
+
+
+def stream_tax_rates(chunk_size=64 * 1024):
+    """Fetch the summary rates, yielding them one by one as they arrive."""
+
+    response = _request(RATES_URL, stream=True)
+    with response:
+        yield from iter_json_array(
+            response.iter_content(chunk_size), 'summary_rates')
 
 
 def fetch_tax_for_address(postal_code, address_data):
     data = fetch_from_api(
         RATES_LOCATION_URL.format(postal_code=postal_code),
-        requests.get,
-        params=address_data)
+        endpoint=RATES_LOCATION_URL, params=address_data)
     validate_data(data)
     return data
 
 
 def fetch_tax_for_order(order_data):
     data = fetch_from_api(
-        ORDER_TAXES_URL, requests.post, json=order_data)
+        ORDER_TAXES_URL, 'post', json=order_data)
     validate_data(data)
     return data
 
@@ -80,12 +707,52 @@ def save_tax_categories(json_data):
     TaxCategories.objects.update_or_create(
         id=DEFAULT_TYPES_INSTANCE_ID, defaults={'types': categories})
 
+    def publish():
+        get_cache().set(taxjar_settings.CATEGORIES_CACHE_KEY, categories,
+                        taxjar_settings.CACHE_TIME)
+        _get_tax_category_index().invalidate()
 
-def create_objects_from_json(json_data):
-    validate_data(json_data)
+    transaction.on_commit(publish)
 
-    # Handle proper response
-    rates = json_data['summary_rates']
+
+def _get_decimal_rate(tax_rates, rate_key):
+    try:
+        return Decimal(str(tax_rates[rate_key]['rate']))
+    except (KeyError, TypeError):
+        return None
+
+
+def get_data_hash(data):
+    """Get a content hash of JSON data that does not depend on key order."""
+
+    payload = json.dumps(data, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def _get_region_cache_key(country_code, region_code):
+    return taxjar_settings.CACHE_KEY + country_code + (region_code or '')
+
+
+def save_tax_rates(rates, dry_run=False):
+    """
+    Save a chunk of summary rates to the database and the cache.
+
+    Existing rows are loaded with one query and only rows whose content hash
+    changed are written, in bulk inside a single transaction.  Only the cache
+    keys of those rows are touched, once the outermost transaction commits.
+
+    Returns a Counter of added, changed and unchanged rates.
+    """
+
+    rates = list(rates)
+    existing = {
+        (tax.country_code, tax.region_code): tax
+        for tax in Tax.objects.filter(
+            country_code__in={rate['country_code'] for rate in rates})}
+    stats = Counter(added=0, changed=0, unchanged=0)
+    to_create = []
+    to_update = {}
+    cache_data = {}
     for rate in rates:
         country_code = rate['country_code']
         region_code = rate['region_code']
@@ -99,13 +766,247 @@ def create_objects_from_json(json_data):
             rate['average_rate']['rate'] = str(rate['average_rate']['rate'])
         except (KeyError):
             pass
+        data_hash = get_data_hash(rate)
+        average_rate = _get_decimal_rate(rate, 'average_rate')
+        minimum_rate = _get_decimal_rate(rate, 'minimum_rate')
+
+        tax = existing.get((country_code, region_code))
+        if tax is None:
+            tax = Tax(country_code=country_code, region_code=region_code,
+                      average_rate=average_rate, minimum_rate=minimum_rate,
+                      data=rate, data_hash=data_hash)
+            existing[(country_code, region_code)] = tax
+            to_create.append(tax)
+            stats['added'] += 1
+        elif tax.data_hash == data_hash:
+            stats['unchanged'] += 1
+            continue
+        else:
+            tax.average_rate = average_rate
+            tax.minimum_rate = minimum_rate
+            tax.data = rate
+            tax.data_hash = data_hash
+            if tax.pk is not None:
+                to_update[tax.pk] = tax
+            stats['changed'] += 1
+        cache_data[_get_region_cache_key(country_code, region_code)] = rate
+
+    if not dry_run:
+        with transaction.atomic():
+            Tax.objects.bulk_create(to_create)
+            Tax.objects.bulk_update(
+                to_update.values(),
+                ['average_rate', 'minimum_rate', 'data', 'data_hash'])
+            transaction.on_commit(lambda: get_cache().set_many(
+                cache_data, taxjar_settings.CACHE_TIME))
+    return stats
+
+
+def delete_missing_tax_rates(seen, dry_run=False):
+    """
+    Delete the rows of regions that are no longer returned by the API.
+
+    seen is a collection of the (country_code, region_code) pairs returned.
+    Returns the number of deleted rows.
+    """
+
+    missing = [
+        (pk, country_code, region_code)
+        for pk, country_code, region_code in Tax.objects.values_list(
+            'pk', 'country_code', 'region_code')
+        if (country_code, region_code) not in seen]
+    if missing and not dry_run:
+        Tax.objects.filter(pk__in=[pk for pk, _, _ in missing]).delete()
+        transaction.on_commit(lambda: get_cache().delete_many([
+            _get_region_cache_key(country_code, region_code)
+            for _, country_code, region_code in missing]))
+    return len(missing)
+
+
+def refresh_tax_rates(rates, chunk_size=100, dry_run=False, progress=None):
+    """
+    Bring the Tax rows in line with an iterable of summary rates.
+
+    Rates are saved in chunks of chunk_size and rows of regions missing from
+    rates are deleted.  progress, if given, is called with the running
+    Counter after every chunk.  Cache writes and the version bump wait for
+    the outermost transaction to commit, so other processes never reload
+    rows that are not committed yet.
+
+    Returns a Counter of added, changed, unchanged and removed rates.
+    """
+
+    stats = Counter(added=0, changed=0, unchanged=0, removed=0)
+    seen = set()
+    for chunk in chunked(rates, chunk_size):
+        stats.update(save_tax_rates(chunk, dry_run=dry_run))
+        seen.update(
+            (rate['country_code'], rate['region_code']) for rate in chunk)
+        if progress is not None:
+            progress(stats)
+    stats['removed'] = delete_missing_tax_rates(seen, dry_run=dry_run)
+    if not dry_run and (stats['added'] or stats['changed'] or
+                        stats['removed']):
+        transaction.on_commit(bump_rates_version)
+    return stats
+
+
+def create_objects_from_json(json_data):
+    validate_data(json_data)
+
+    # Handle proper response
+    return refresh_tax_rates(json_data['summary_rates'])
+
+
+def call_with_retries(function, retries=3, backoff=0.5):
+    """
+    Call function, retrying failed attempts with exponential backoff.
+
+    Waits backoff, then twice as long after each further failure, or as
+    long as a Retry-After header asks if that is longer.  Errors reported by
+    TaxJar raise ImproperlyConfigured and are not retried, except for rate
+    limits and server errors (APIUnavailableError).
+    """
+
+    for attempt in range(retries + 1):
+        try:
+            return function()
+        except Exception as error:
+            if attempt == retries or (
+                    isinstance(error, ImproperlyConfigured) and
+                    not isinstance(error, APIUnavailableError)):
+                raise
+            delay = backoff * 2 ** attempt
+            time.sleep(max(delay, getattr(error, 'retry_after', None) or 0))
+
+
+def chunked(iterable, size):
+    """Split an iterable into lists of at most size items."""
+
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_json_array(chunks, key):
+    """
+    Incrementally parse the items of the top-level array stored under key.
+
+    chunks is an iterable of str or UTF-8 encoded bytes holding a JSON
+    object, e.g. the body of a streamed response.  Only the item being
+    parsed is kept in memory.  If the array is missing, the whole document
+    is parsed and validated, so API errors are raised as usual.
+    """
+
+    decoder = json.JSONDecoder()
+    utf8_decoder = codecs.getincrementaldecoder('utf-8')()
+    start = re.compile(r'"{}"\s*:\s*\['.format(re.escape(key)))
+    chunks = iter(chunks)
+
+    def read():
+        chunk = next(chunks, None)
+        if isinstance(chunk, bytes):
+            chunk = utf8_decoder.decode(chunk)
+        return chunk
+
+    buffer = ''
+    match = None
+    while match is None:
+        chunk = read()
+        if chunk is None:
+            data = json.loads(buffer)
+            validate_data(data)
+            raise ImproperlyConfigured(
+                'Response is missing "{}"'.format(key))
+        buffer += chunk
+        match = start.search(buffer)
+
+    position = match.end()
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position < len(buffer) and buffer[position] == ']':
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except ValueError:
+            pass
+        else:
+            # A number or literal at the end of the buffer may go on in the
+            # next chunk, only accept an item once what follows it is read.
+            following = end
+            while following < len(buffer) and buffer[following] in ' \t\r\n':
+                following += 1
+            if following < len(buffer):
+                yield item
+                position = end
+                continue
+        chunk = read()
+        if chunk is None:
+            raise ImproperlyConfigured(
+                'Response ended in the middle of "{}"'.format(key))
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def load_rates_index():
+    """Load an immutable index of all region rates from the database."""
+
+    started = time.monotonic()
+    index = {}
+    rows = Tax.objects.values_list(
+        'country_code', 'region_code', 'average_rate', 'minimum_rate', 'data')
+    for country_code, region_code, average_rate, minimum_rate, data in rows:
+        index[(country_code, region_code)] = RegionRates(
+            average_rate=average_rate, minimum_rate=minimum_rate, data=data)
+    get_instrumentation().db_query(
+        'rates_index', time.monotonic() - started)
+    return MappingProxyType(index)
+
+
+def get_rates_index():
+    """
+    Get the in-process index of region rates, keyed by (country, region).
 
-        Tax.objects.update_or_create(
-            country_code=country_code, region_code=region_code,
-            defaults={'data': rate})
-        country_region_cache_key = CACHE_KEY + \
-            country_code + (region_code or '')
-        cache.set(country_region_cache_key, rate, CACHE_TIME)
+    The index is loaded once per process and reloaded when the version
+    stamp bumped by create_objects_from_json changes.  The stamp is checked
+    at most every TAXJAR_LOCAL_RATES_CHECK_INTERVAL seconds.
+    """
+
+    return _get_rates_index().get()
+
+
+def bump_rates_version():
+    """Invalidate the in-process rate indexes and caches of all processes."""
+
+    _get_rates_index().invalidate()
+    invalidate_local_cache()
+
+
+def _get_rates_index():
+    global _rates_index
+
+    if _rates_index is None:
+        _rates_index = VersionedValue(
+            get_shared_cache, taxjar_settings.RATES_VERSION_CACHE_KEY,
+            load_rates_index,
+            taxjar_settings.LOCAL_RATES_CHECK_INTERVAL)
+    return _rates_index
+
+
+def get_region_rates(country_code: str, region_code: str=None):
+    """
+    Get the Decimal rates for a given region from the in-process index.
+
+    Returns None if the region is unknown.
+    """
+
+    return get_rates_index().get((country_code, region_code))
 
 
 def get_tax_rates_for_region(country_code: str, region_code: str=None,
@@ -118,21 +1019,51 @@ def get_tax_rates_for_region(country_code: str, region_code: str=None,
 
     In the US, region_code is the state/territory postal code.
     In Canada, region_code is the province/territory postal code.
+
+    With TAXJAR_LOCAL_RATES enabled, rates are read from the in-process
+    index instead of the cache.
     """
 
-    country_region_cache_key = CACHE_KEY + country_code + (region_code or '')
-    tax_rates = cache.get(country_region_cache_key)
-    if not tax_rates or force_refresh:
+    instrumentation = get_instrumentation()
+    if taxjar_settings.LOCAL_RATES and not force_refresh:
+        region_rates = get_region_rates(country_code, region_code)
+        instrumentation.cache_lookup(
+            'region', 'hit' if region_rates else 'miss', 'local')
+        return region_rates.data if region_rates else None
+
+    country_region_cache_key = _get_region_cache_key(country_code, region_code)
+    tax_rates = get_cache().get(country_region_cache_key)
+    if not force_refresh:
+        instrumentation.cache_lookup(
+            'region', 'miss' if tax_rates is None else 'hit')
+    if tax_rates is None or force_refresh:
+        started = time.monotonic()
         try:
-            region_tax = Tax.objects.get(country_code=country_code,
-                                         region_code=region_code)
-            tax_rates = region_tax.data
-            cache.set(country_region_cache_key, tax_rates, CACHE_TIME)
+            tax_rates = Tax.objects.values_list('data', flat=True).get(
+                country_code=country_code, region_code=region_code)
         except ObjectDoesNotExist:
             tax_rates = None
+        instrumentation.db_query('region', time.monotonic() - started)
+        if tax_rates is None:
+            get_cache().set(country_region_cache_key, NOT_FOUND,
+                            taxjar_settings.NEGATIVE_CACHE_TIME)
+        else:
+            get_cache().set(country_region_cache_key, tax_rates,
+                            taxjar_settings.CACHE_TIME)
+    if tax_rates == NOT_FOUND:
+        return None
     return tax_rates
 
 
+async def aget_tax_rates_for_region(country_code: str,
+                                    region_code: str=None,
+                                    force_refresh: bool=False):
+    """Async version of get_tax_rates_for_region."""
+
+    return await _sync_to_async(get_tax_rates_for_region)(
+        country_code, region_code, force_refresh)
+
+
 def get_tax_rate(tax_rates: dict, rate_name=None):
     """
     Get the tax rate for a set of tax rates and a given rate_name.
@@ -161,19 +1092,460 @@ def get_tax_for_rate(tax_rates: dict, rate_name=None):
     if rate is None:
         return None
 
-    final_tax_rate = Decimal(rate)
+    return get_flat_tax(rate)
 
-    def tax(base, keep_gross=False):
-        return flat_tax(base, final_tax_rate, keep_gross=keep_gross)
 
-    return tax
+@lazy_lru_cache(lambda: taxjar_settings.TAX_CALLABLE_CACHE_SIZE)
+def get_flat_tax(rate):
+    """
+    Get the tax callable for a rate, given as a string or Decimal.
+
+    The same callable is returned for the same rate, so the rate is parsed
+    once no matter how often it is applied.
+    """
+
+    return FlatTax(Decimal(str(rate)))
+
+
+@lazy_lru_cache(lambda: taxjar_settings.TAX_CALLABLE_CACHE_SIZE)
+def get_amount_tax(amount):
+    """Get the tax callable for a fixed amount, as a string or Decimal."""
+
+    return AmountTax(Decimal(str(amount)))
+
+
+def load_tax_category_index():
+    """Load the tax categories, indexed by product_tax_code."""
+
+    instrumentation = get_instrumentation()
+    categories = get_cache().get(taxjar_settings.CATEGORIES_CACHE_KEY)
+    instrumentation.cache_lookup(
+        'categories', 'miss' if categories is None else 'hit')
+    if categories is None:
+        started = time.monotonic()
+        tax_categories = TaxCategories.objects.singleton()
+        categories = tax_categories.types if tax_categories else []
+        instrumentation.db_query('categories', time.monotonic() - started)
+        get_cache().set(taxjar_settings.CATEGORIES_CACHE_KEY, categories,
+                        taxjar_settings.CACHE_TIME)
+    by_code = {
+        category['product_tax_code']: category for category in categories}
+    return TaxCategoryIndex(
+        categories=tuple(categories), by_code=MappingProxyType(by_code))
+
+
+def _get_tax_category_index():
+    global _tax_category_index
+
+    if _tax_category_index is None:
+        _tax_category_index = VersionedValue(
+            get_shared_cache, taxjar_settings.CATEGORIES_VERSION_CACHE_KEY,
+            load_tax_category_index,
+            taxjar_settings.CATEGORIES_CHECK_INTERVAL)
+    return _tax_category_index
 
 
 def get_tax_categories():
-    """Get a list of the available tax categories offered."""
+    """
+    Get a list of the available tax categories offered.
+
+    Categories are kept in the cache and in process memory until
+    save_tax_categories stores new ones.
+    """
+
+    return list(_get_tax_category_index().get().categories)
+
+
+def get_tax_category(product_tax_code: str):
+    """Get the tax category with a given product_tax_code, or None."""
+
+    return _get_tax_category_index().get().by_code.get(product_tax_code)
+
+
+def is_valid_product_tax_code(product_tax_code: str):
+    """Tell whether product_tax_code belongs to a known tax category."""
+
+    return product_tax_code in _get_tax_category_index().get().by_code
+
+
+def _normalize_key_part(value):
+    return ' '.join(str(value).split()).upper() if value else ''
+
+
+def make_address_cache_key(postal_code, country_code=None, region_code=None,
+                           city=None, street=None):
+    """
+    Build the cache key of an address.
+
+    Every field is upper-cased and has its whitespace collapsed, so that
+    near-identical addresses share a key, and the result is hashed, so keys
+    have a fixed length and are safe for every cache backend.
+    """
+
+    address = '|'.join(_normalize_key_part(part) for part in (
+        postal_code, country_code, region_code, city, street))
+    digest = hashlib.sha1(address.encode('utf-8')).hexdigest()
+    return '{}:{}'.format(taxjar_settings.INDIVIDUAL_CACHE_KEY, digest)
+
+
+def _get_address_data(country_code, region_code, city, street):
+    additional_data = {}
+    if country_code:
+        additional_data['country'] = country_code
+    if region_code:
+        additional_data['state'] = region_code
+    if city:
+        additional_data['city'] = city
+    if street:
+        additional_data['street'] = street
+    return additional_data
+
+
+def _parse_address_rates(rates):
+    components = {}
+    for name, value in rates.items():
+        if name.endswith('_rate') and name != 'combined_rate' and \
+                value is not None:
+            components[name] = Decimal(str(value))
+    return AddressRates(
+        combined_rate=Decimal(str(rates['combined_rate'])),
+        freight_taxable=bool(rates.get('freight_taxable')),
+        components=components,
+        data=rates)
+
+
+def _get_request_memo():
+    return getattr(_request_memo, 'rates', None)
+
+
+def _start_request_memo(**kwargs):
+    _request_memo.rates = {}
+
+
+def _clear_request_memo(**kwargs):
+    _request_memo.rates = None
+
+
+def _reset_local_state(setting, **kwargs):
+    """Drop the objects built from settings when one of them changes."""
+
+    global _order_cache, _instrumentation, _hot_addresses, \
+        _circuit_breaker, _tiered_cache, _rate_table, _rates_index, \
+        _tax_category_index
+
+    if setting not in SETTING_NAMES and setting != 'CACHES':
+        return
+    if _rate_table is not None:
+        _rate_table.close()
+    _order_cache = _instrumentation = _hot_addresses = _circuit_breaker = \
+        _tiered_cache = _rate_table = _rates_index = _tax_category_index = \
+        None
+    get_flat_tax.cache_clear()
+    get_amount_tax.cache_clear()
+    set_session(None)
+    _async_clients.clear()
+
+
+setting_changed.connect(
+    _reset_local_state, dispatch_uid='taxjar_reset_local_state')
+request_started.connect(
+    _start_request_memo, dispatch_uid='taxjar_start_request_memo')
+request_finished.connect(
+    _clear_request_memo, dispatch_uid='taxjar_clear_request_memo')
+
+
+def get_rate_table():
+    """
+    Get the offline rate table configured by TAXJAR_RATE_TABLE_PATH.
+
+    Returns None if no table is configured.  The table is mapped once per
+    process, so a new table is used after a restart.
+    """
+
+    global _rate_table
+
+    if taxjar_settings.RATE_TABLE_PATH is None:
+        return None
+    if _rate_table is None:
+        _rate_table = RateTable(taxjar_settings.RATE_TABLE_PATH)
+    return _rate_table
+
+
+def _get_offline_address_rates(postal_code, country_code, street):
+    # Street-level precision is only available from the API.
+    if street:
+        return None
+    table = get_rate_table()
+    if table is None:
+        return None
+    rates = table.get(postal_code, country_code)
+    return _parse_address_rates(rates) if rates is not None else None
+
+
+def _get_fallback_address_rates(country_code, region_code):
+    """
+    Build a rate record from the summary rate of the address's region.
+
+    Used while the circuit is open and no copy of the address's own record
+    is left.  Returns None if the region is unknown.
+    """
+
+    country_code = country_code or 'US'
+    rate = get_tax_rate(get_tax_rates_for_region(country_code, region_code))
+    if rate is None:
+        return None
+    rates = {'country': country_code, 'combined_rate': str(rate),
+             'freight_taxable': False}
+    if region_code:
+        rates['state'] = region_code
+    return rates
+
 
-    categories = TaxCategories.objects.singleton()
-    return categories.types if categories else []
+def _get_hot_addresses():
+    global _hot_addresses, _hot_addresses_flushed
+
+    if _hot_addresses is None and taxjar_settings.HOT_ADDRESSES:
+        _hot_addresses = FrequencySketch(taxjar_settings.HOT_ADDRESSES)
+        _hot_addresses_flushed = time.monotonic()
+    return _hot_addresses
+
+
+def _record_address(address_cache_key, address):
+    """
+    Count a lookup of address for the cache warmer.
+
+    Returns True if the caller should run flush_hot_addresses(); only one
+    caller per flush interval gets True.
+    """
+
+    global _hot_addresses_flushed
+
+    sketch = _get_hot_addresses()
+    if sketch is None:
+        return False
+    sketch.record(address_cache_key, address)
+    now = time.monotonic()
+    if now - _hot_addresses_flushed < \
+            taxjar_settings.HOT_ADDRESSES_FLUSH_INTERVAL:
+        return False
+    _hot_addresses_flushed = now
+    return True
+
+
+def flush_hot_addresses():
+    """
+    Merge the addresses counted in this process into the shared cache.
+
+    The shared counts are a best-effort estimate: concurrent flushes from
+    several processes may overwrite each other.
+    """
+
+    global _hot_addresses_flushed
+
+    sketch = _get_hot_addresses()
+    if sketch is None:
+        return
+    _hot_addresses_flushed = time.monotonic()
+    local = sketch.most_common()
+    sketch.clear()
+    if not local:
+        return
+    shared_cache = get_shared_cache()
+    hot = shared_cache.get(taxjar_settings.HOT_ADDRESSES_CACHE_KEY) or {}
+    for key, count, address in local:
+        hot[key] = (hot.get(key, (0, None))[0] + count, address)
+    hot = dict(sorted(
+        hot.items(), key=lambda item: item[1][0],
+        reverse=True)[:taxjar_settings.HOT_ADDRESSES])
+    shared_cache.set(taxjar_settings.HOT_ADDRESSES_CACHE_KEY, hot, None)
+
+
+def get_hot_addresses(limit: int=None):
+    """
+    Get the most requested addresses, the most requested first.
+
+    Addresses are dicts with the keyword arguments of get_rates_for_address.
+    """
+
+    hot = get_shared_cache().get(
+        taxjar_settings.HOT_ADDRESSES_CACHE_KEY) or {}
+    addresses = [
+        dict(zip(ADDRESS_FIELDS, address)) for _, address in sorted(
+            hot.values(), key=lambda value: value[0], reverse=True)]
+    return addresses if limit is None else addresses[:limit]
+
+
+def warm_region_cache(chunk_size=500):
+    """Load the rates of every region into the cache in bulk."""
+
+    count = 0
+    rows = Tax.objects.values_list(
+        'country_code', 'region_code', 'data').iterator()
+    for chunk in chunked(rows, chunk_size):
+        get_cache().set_many({
+            _get_region_cache_key(country_code, region_code): data
+            for country_code, region_code, data in chunk},
+            taxjar_settings.CACHE_TIME)
+        count += len(chunk)
+    return count
+
+
+def warm_address_cache(limit: int=None, ahead: float=None,
+                       max_workers: int=None):
+    """
+    Refresh the most requested addresses before they expire.
+
+    Addresses that are missing from the cache or expire within ahead
+    seconds (default a tenth of TAXJAR_CACHE_TTL) are fetched again on up
+    to max_workers threads.  Addresses that fail are skipped and the others
+    are still refreshed.  Afterwards the shared counts are halved, so
+    addresses that are no longer requested drop out.
+
+    Returns a Counter of refreshed and failed addresses.
+    """
+
+    flush_hot_addresses()
+    if ahead is None:
+        ahead = taxjar_settings.CACHE_TIME / 10
+    addresses = get_hot_addresses(limit)
+    keys = [make_address_cache_key(**address) for address in addresses]
+    entries = get_cache().get_many(keys)
+    deadline = time.time() + ahead
+    expiring = {
+        key: address for key, address in zip(keys, addresses)
+        if not isinstance(entries.get(key), CacheEntry) or
+        entries[key].expires <= deadline}
+    errors = {}
+    refreshed = {}
+    if expiring:
+        refreshed = _fetch_addresses_rates(
+            expiring, entries, max_workers, errors)
+
+    shared_cache = get_shared_cache()
+    hot = shared_cache.get(taxjar_settings.HOT_ADDRESSES_CACHE_KEY)
+    if hot:
+        hot = {key: (count // 2, address)
+               for key, (count, address) in hot.items() if count // 2}
+        shared_cache.set(taxjar_settings.HOT_ADDRESSES_CACHE_KEY, hot, None)
+    return Counter(addresses=len(refreshed), failed=len(errors))
+
+
+def warm_cache(limit: int=None, ahead: float=None, max_workers: int=None):
+    """
+    Warm the cache with every region and the most requested addresses.
+
+    Meant to run periodically, e.g. after deploys or from a task scheduler.
+    Returns a Counter of warmed regions and addresses and of addresses that
+    failed to refresh.
+    """
+
+    regions = warm_region_cache()
+    stats = warm_address_cache(limit, ahead, max_workers)
+    stats['regions'] = regions
+    return stats
+
+
+def _resolve_address_rates(postal_code, country_code, region_code, city,
+                           street, force_refresh):
+    """
+    Get the parsed rate record for an address.
+
+    Records are memoized for the duration of the current HTTP request, so
+    looking up several views of the same address costs one cache read.
+    """
+
+    address_rates = _get_offline_address_rates(
+        postal_code, country_code, street)
+    if address_rates is not None:
+        return address_rates
+
+    address_cache_key = make_address_cache_key(
+        postal_code, country_code, region_code, city, street)
+    memo = _get_request_memo()
+    if memo is not None and not force_refresh and address_cache_key in memo:
+        return memo[address_cache_key]
+
+    def refresh():
+        additional_data = _get_address_data(
+            country_code, region_code, city, street)
+        return fetch_tax_for_address(postal_code, additional_data)['rate']
+
+    try:
+        rates = _get_or_refresh(address_cache_key, refresh, force_refresh)
+    except CircuitOpenError:
+        rates = _get_fallback_address_rates(country_code, region_code)
+        if rates is None:
+            raise
+    address_rates = _parse_address_rates(rates)
+    # Only addresses that resolve are counted, so the warmer does not keep
+    # refetching addresses the API rejects.
+    if _record_address(
+            address_cache_key,
+            (postal_code, country_code, region_code, city, street)):
+        flush_hot_addresses()
+    if memo is not None:
+        memo[address_cache_key] = address_rates
+    return address_rates
+
+
+async def _aresolve_address_rates(postal_code, country_code, region_code,
+                                  city, street, force_refresh):
+    address_rates = _get_offline_address_rates(
+        postal_code, country_code, street)
+    if address_rates is not None:
+        return address_rates
+
+    address_cache_key = make_address_cache_key(
+        postal_code, country_code, region_code, city, street)
+
+    async def refresh():
+        additional_data = _get_address_data(
+            country_code, region_code, city, street)
+        data = await afetch_tax_for_address(postal_code, additional_data)
+        return data['rate']
+
+    try:
+        rates = await _aget_or_refresh(
+            address_cache_key, refresh, force_refresh)
+    except CircuitOpenError:
+        rates = await _sync_to_async(_get_fallback_address_rates)(
+            country_code, region_code)
+        if rates is None:
+            raise
+    address_rates = _parse_address_rates(rates)
+    if _record_address(
+            address_cache_key,
+            (postal_code, country_code, region_code, city, street)):
+        # Flushing reads and writes the shared cache, keep it off the loop.
+        await _sync_to_async(flush_hot_addresses, thread_sensitive=False)()
+    return address_rates
+
+
+def _get_tax_for_address_rates(address_rates):
+    return get_flat_tax(address_rates.combined_rate)
+
+
+def get_rates_for_address(postal_code: str, country_code: str=None,
+                          region_code: str=None, city: str=None,
+                          street: str=None, force_refresh: bool=False):
+    """
+    Get the full rate record for a given address.
+
+    The record holds the combined rate, whether shipping is taxable and the
+    per-jurisdiction rates, all as Decimals, along with the raw API data.
+    """
+
+    return _resolve_address_rates(
+        postal_code, country_code, region_code, city, street, force_refresh)
+
+
+async def aget_rates_for_address(postal_code: str, country_code: str=None,
+                                 region_code: str=None, city: str=None,
+                                 street: str=None, force_refresh: bool=False):
+    """Async version of get_rates_for_address."""
+
+    return await _aresolve_address_rates(
+        postal_code, country_code, region_code, city, street, force_refresh)
 
 
 def get_tax_for_address(postal_code: str, country_code: str=None,
@@ -186,35 +1558,19 @@ def get_tax_for_address(postal_code: str, country_code: str=None,
     the potentially more accurate the final result.
     """
 
-    address_cache_key = INDIVIDUAL_CACHE_KEY + postal_code + \
-        (country_code or '') + (region_code or '') + \
-        (city or '') + (street or '')
-    address_cache_key = address_cache_key.replace(' ', '_')
-
-    rates = cache.get(address_cache_key)
-    if not rates or force_refresh:
-        additional_data = {}
-        if country_code:
-            additional_data['country'] = country_code
-        if region_code:
-            additional_data['state'] = region_code
-        if city:
-            additional_data['city'] = city
-        if street:
-            additional_data['street'] = street
-
-        rates = fetch_tax_for_address(postal_code, additional_data)['rate']
+    address_rates = _resolve_address_rates(
+        postal_code, country_code, region_code, city, street, force_refresh)
+    return _get_tax_for_address_rates(address_rates)
 
-        cache.set(address_cache_key, rates, CACHE_TIME)
 
-    rate = rates['combined_rate']
+async def aget_tax_for_address(postal_code: str, country_code: str=None,
+                               region_code: str=None, city: str=None,
+                               street: str=None, force_refresh: bool=False):
+    """Async version of get_tax_for_address."""
 
-    final_tax_rate = Decimal(rate)
-
-    def tax(base, keep_gross=False):
-        return flat_tax(base, final_tax_rate, keep_gross=keep_gross)
-
-    return tax
+    address_rates = await _aresolve_address_rates(
+        postal_code, country_code, region_code, city, street, force_refresh)
+    return _get_tax_for_address_rates(address_rates)
 
 
 def is_shipping_taxable_for_address(postal_code: str, country_code: str=None,
@@ -227,49 +1583,158 @@ def is_shipping_taxable_for_address(postal_code: str, country_code: str=None,
     the potentially more accurate the final result.
     """
 
-    address_cache_key = INDIVIDUAL_CACHE_KEY + postal_code + \
-        (country_code or '') + (region_code or '') + \
-        (city or '') + (street or '')
-    address_cache_key = address_cache_key.replace(' ', '_')
+    address_rates = _resolve_address_rates(
+        postal_code, country_code, region_code, city, street, force_refresh)
+    return address_rates.freight_taxable
 
-    rates = cache.get(address_cache_key)
-    if not rates or force_refresh:
-        additional_data = {}
-        if country_code:
-            additional_data['country'] = country_code
-        if region_code:
-            additional_data['state'] = region_code
-        if city:
-            additional_data['city'] = city
-        if street:
-            additional_data['street'] = street
 
-        rates = fetch_tax_for_address(postal_code, additional_data)['rate']
+async def ais_shipping_taxable_for_address(
+        postal_code: str, country_code: str=None, region_code: str=None,
+        city: str=None, street: str=None, force_refresh: bool=False):
+    """Async version of is_shipping_taxable_for_address."""
 
-        cache.set(address_cache_key, rates, CACHE_TIME)
+    address_rates = await _aresolve_address_rates(
+        postal_code, country_code, region_code, city, street, force_refresh)
+    return address_rates.freight_taxable
 
-    return rates['freight_taxable']
 
+def _fetch_address_rates(address, entry):
+    """
+    Fetch the rate record of an address from the API.
 
-def get_taxes_for_order(shipping_cost: Money, country_code: str,
-                        postal_code: str=None, region_code: str=None,
-                        city: str=None, street: str=None, amount: Money=None,
-                        line_items: Iterable[LineItem]=None):
+    Returns the record and the time the request took, or None instead of
+    the time if the record is a fallback that must not be cached.
     """
-    Get the tax for an individual order.
 
-    amount or line_items is required.  line_items will take precedence if both
-    are included.
+    additional_data = _get_address_data(
+        address.get('country_code'), address.get('region_code'),
+        address.get('city'), address.get('street'))
+    started = time.monotonic()
+    try:
+        address_rates = fetch_tax_for_address(
+            address['postal_code'], additional_data)['rate']
+    except Exception as error:
+        # Fall back without caching, see _get_or_refresh.
+        if isinstance(entry, CacheEntry) and _is_fetch_error(error):
+            return entry.value, None
+        if not isinstance(error, CircuitOpenError):
+            raise
+        address_rates = _get_fallback_address_rates(
+            address.get('country_code'), address.get('region_code'))
+        if address_rates is None:
+            raise
+        return address_rates, None
+    return address_rates, time.monotonic() - started
+
+
+def _fetch_addresses_rates(addresses, entries, max_workers, errors=None):
+    """
+    Fetch the rate records of addresses, a dict keyed by cache key.
 
-    line_items is an iterable collection of django_prices_taxjar.LineItem.
+    Requests run on up to max_workers threads and the new records are
+    stored with a single set_many.  If errors is a dict, addresses that fail
+    are left out of the result and their exceptions are put in errors;
+    otherwise the first failure is raised.
+    """
 
-    If country_code is 'US', then postal_code is required.
-    If country_code is 'US' or 'CA', then region_code is required.
+    def fetch(key, address):
+        try:
+            return _fetch_address_rates(address, entries.get(key))
+        except Exception as error:
+            if errors is None:
+                raise
+            errors[key] = error
+            return None
+
+    workers = min(
+        max_workers or taxjar_settings.MAX_CONCURRENCY, len(addresses))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(fetch, addresses, addresses.values()))
+    rates = {}
+    new_entries = {}
+    for key, result in zip(addresses, results):
+        if result is None:
+            continue
+        address_rates, delta = result
+        rates[key] = address_rates
+        if delta is not None:
+            new_entries[key] = _make_cache_entry(address_rates, delta)
+    if new_entries:
+        get_cache().set_many(new_entries, _get_entry_timeout())
+    return rates
+
+
+def get_rates_for_addresses(addresses: Iterable[Mapping],
+                            force_refresh: bool=False,
+                            max_workers: int=None):
+    """
+    Get the rate records for many addresses at once.
+
+    addresses is an iterable of mappings with the keyword arguments of
+    get_rates_for_address (postal_code, country_code, region_code, city and
+    street).  Cached records are read with a single get_many, the missing
+    ones are fetched concurrently on up to max_workers threads (default
+    TAXJAR_MAX_CONCURRENCY) and stored with a single set_many.  Records are
+    returned in input order.
+    """
 
-    WARNING: This explicitly does not cache the results, as this could change
-    very quickly based off of the individual line items and any associated tax
-    code.
+    addresses = [dict(address) for address in addresses]
+    keys = [make_address_cache_key(
+        address['postal_code'], address.get('country_code'),
+        address.get('region_code'), address.get('city'),
+        address.get('street')) for address in addresses]
+
+    parsed = {}
+    for key, address in zip(keys, addresses):
+        address_rates = _get_offline_address_rates(
+            address['postal_code'], address.get('country_code'),
+            address.get('street'))
+        if address_rates is not None:
+            parsed[key] = address_rates
+
+    online_keys = set(keys) - set(parsed)
+    entries = {}
+    if online_keys and not force_refresh:
+        entries = get_cache().get_many(online_keys)
+    rates = {
+        key: entry.value for key, entry in entries.items()
+        if _is_cache_entry_fresh(entry)}
+    if not force_refresh:
+        instrumentation = get_instrumentation()
+        for outcome, count in [
+                ('hit', len(rates)), ('stale', len(entries) - len(rates)),
+                ('miss', len(online_keys) - len(entries))]:
+            if count:
+                instrumentation.cache_lookup('address', outcome, count=count)
+    missing = {}
+    for key, address in zip(keys, addresses):
+        if key not in rates and key not in parsed:
+            missing.setdefault(key, address)
+    if missing:
+        rates.update(_fetch_addresses_rates(missing, entries, max_workers))
+
+    parsed.update(
+        (key, _parse_address_rates(value)) for key, value in rates.items())
+    return [parsed[key] for key in keys]
+
+
+def get_taxes_for_addresses(addresses: Iterable[Mapping],
+                            force_refresh: bool=False):
+    """
+    Get the taxes for many addresses at once.
+
+    See get_rates_for_addresses for the format of addresses.  Returns a list
+    of tax callables in input order.
     """
+
+    return [
+        _get_tax_for_address_rates(address_rates)
+        for address_rates in get_rates_for_addresses(
+            addresses, force_refresh)]
+
+
+def _get_order_data(shipping_cost, country_code, postal_code, region_code,
+                    city, street, amount, line_items):
     if amount is None and line_items is None:
         raise TypeError('At least one of amount or line_items is required.')
 
@@ -286,17 +1751,177 @@ def get_taxes_for_order(shipping_cost: Money, country_code: str,
         data['to_city'] = city
     if street:
         data['to_street'] = street
-    if line_items:
-        data['line_items'] = list(
-            map(lambda item: item.dictionary, line_items))
+    if isinstance(line_items, LineItemBatch) and line_items:
+        data['line_items'] = line_items.dictionaries
+    elif line_items:
+        data['line_items'] = [item.dictionary for item in line_items]
     else:
         data['amount'] = str(amount.amount)
+    return data
+
+
+def _get_order_cache():
+    global _order_cache
+
+    if _order_cache is None:
+        _order_cache = LocalCache(
+            taxjar_settings.ORDER_CACHE_MAX_ENTRIES,
+            taxjar_settings.ORDER_CACHE_TIME)
+    return _order_cache
+
+
+def _encode_order_data(order_data, measure):
+    """
+    Encode order_data once for the order cache key and the payload size.
+
+    Returns None if neither the order cache nor the instrumentation needs
+    it, so orders are not serialized one more time for nothing.
+    """
+
+    if not (taxjar_settings.ORDER_CACHE_TIME or measure):
+        return None
+    return json.dumps(
+        order_data, sort_keys=True, separators=(',', ':')).encode('utf-8')
 
-    response = fetch_tax_for_order(data)
 
-    amount_to_collect = Decimal(str(response['tax']['amount_to_collect']))
+def _get_order_cache_key(payload):
+    return hashlib.sha256(payload).hexdigest()
 
-    def tax(base, keep_gross=False):
-        return tax_amount(base, amount_to_collect, keep_gross=keep_gross)
 
+def _get_tax_for_order_response(response):
+    return get_amount_tax(str(response['tax']['amount_to_collect']))
+
+
+def _lookup_order_tax(data):
+    """
+    Look an order up in the order cache before it is sent to the API.
+
+    Returns (tax, order_cache_key).  tax is the cached tax, or None if the
+    order has to be sent, in which case its payload size is reported and
+    the response goes to _store_order_tax with order_cache_key.
+    """
+
+    instrumentation = get_instrumentation()
+    measure = instrumentation.measures_payload_size
+    payload = _encode_order_data(data, measure)
+    order_cache_key = None
+    if taxjar_settings.ORDER_CACHE_TIME:
+        order_cache_key = _get_order_cache_key(payload)
+        tax = _get_order_cache().get(order_cache_key)
+        instrumentation.cache_lookup(
+            'order', 'miss' if tax is None else 'hit', 'local')
+        if tax is not None:
+            return tax, None
+    if measure:
+        instrumentation.payload_size('order', len(payload))
+    return None, order_cache_key
+
+
+def _store_order_tax(order_cache_key, response):
+    tax = _get_tax_for_order_response(response)
+    if order_cache_key is not None:
+        _get_order_cache().set(order_cache_key, tax)
     return tax
+
+
+def get_taxes_for_order(shipping_cost: Money, country_code: str,
+                        postal_code: str=None, region_code: str=None,
+                        city: str=None, street: str=None, amount: Money=None,
+                        line_items: Iterable[LineItem]=None):
+    """
+    Get the tax for an individual order.
+
+    amount or line_items is required.  line_items will take precedence if both
+    are included.
+
+    line_items is an iterable collection of django_prices_taxjar.LineItem,
+    or a django_prices_taxjar.LineItemBatch for large orders.
+
+    If country_code is 'US', then postal_code is required.
+    If country_code is 'US' or 'CA', then region_code is required.
+
+    WARNING: By default this does not cache the results, as this could change
+    very quickly based off of the individual line items and any associated tax
+    code.  With a positive TAXJAR_ORDER_CACHE_TTL, identical requests are
+    answered from an in-process cache keyed on a hash of the payload.
+    """
+    data = _get_order_data(shipping_cost, country_code, postal_code,
+                           region_code, city, street, amount, line_items)
+    tax, order_cache_key = _lookup_order_tax(data)
+    if tax is not None:
+        return tax
+    response = fetch_tax_for_order(data)
+    return _store_order_tax(order_cache_key, response)
+
+
+async def aget_taxes_for_order(shipping_cost: Money, country_code: str,
+                               postal_code: str=None, region_code: str=None,
+                               city: str=None, street: str=None,
+                               amount: Money=None,
+                               line_items: Iterable[LineItem]=None):
+    """Async version of get_taxes_for_order."""
+    data = _get_order_data(shipping_cost, country_code, postal_code,
+                           region_code, city, street, amount, line_items)
+    tax, order_cache_key = _lookup_order_tax(data)
+    if tax is not None:
+        return tax
+    response = await afetch_tax_for_order(data)
+    return _store_order_tax(order_cache_key, response)
+
+
+def estimate_taxes_for_order(shipping_cost: Money, country_code: str,
+                             postal_code: str=None, region_code: str=None,
+                             city: str=None, street: str=None,
+                             amount: Money=None,
+                             line_items: Iterable[LineItem]=None):
+    """
+    Estimate the tax for an individual order without calling the API.
+
+    Takes the same arguments as get_taxes_for_order and returns the same
+    kind of tax callable, but computes the amount to collect locally from
+    the cached rates of the address (or the summary rate of the region if
+    postal_code is not given).  Shipping is taxed if the address says so
+    and line items with a code in TAXJAR_EXEMPT_PRODUCT_TAX_CODES are not
+    taxed.
+
+    Returns None if postal_code is not given and there is no rate for the
+    region, like get_tax_for_rate, rather than a zero tax.
+
+    This is meant for previews such as cart totals, the final order should
+    still go through get_taxes_for_order.
+    """
+    if amount is None and line_items is None:
+        raise TypeError('At least one of amount or line_items is required.')
+
+    if postal_code:
+        address_rates = _resolve_address_rates(
+            postal_code, country_code, region_code, city, street, False)
+        rate = address_rates.combined_rate
+        freight_taxable = address_rates.freight_taxable
+    else:
+        rate = get_tax_rate(get_tax_rates_for_region(
+            country_code, region_code))
+        if rate is None:
+            return None
+        rate = Decimal(str(rate))
+        freight_taxable = False
+
+    if line_items:
+        taxable_amount = Decimal(0)
+        for item in line_items:
+            product_tax_code = (
+                item.product_tax_code or
+                taxjar_settings.DEFAULT_TAXJAR_PRODUCT_TAX_CODE)
+            if product_tax_code in taxjar_settings.EXEMPT_PRODUCT_TAX_CODES:
+                continue
+            taxable_amount += item.unit_price.amount * item.quantity
+            if item.discount:
+                taxable_amount -= item.discount.amount
+    else:
+        taxable_amount = amount.amount
+    if freight_taxable:
+        taxable_amount += shipping_cost.amount
+
+    amount_to_collect = Money(
+        taxable_amount * rate, shipping_cost.currency).quantize()
+    return get_amount_tax(amount_to_collect.amount)
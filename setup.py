@@ -10,8 +10,8 @@ CLASSIFIERS = [
     'License :: OSI Approved :: BSD License',
     'Operating System :: OS Independent',
     'Programming Language :: Python',
-    'Programming Language :: Python :: 3.5',
-    'Programming Language :: Python :: 3.6',
+    'Programming Language :: Python :: 3.7',
+    'Programming Language :: Python :: 3.8',
     'Topic :: Internet :: WWW/HTTP',
     'Topic :: Internet :: WWW/HTTP :: Dynamic Content',
     'Topic :: Software Development :: Libraries :: Application Frameworks',
@@ -31,6 +31,9 @@ setup(
     include_package_data=True,
     classifiers=CLASSIFIERS,
     install_requires=[
-        'Django>=1.11', 'prices>=1.0.0', 'requests', 'jsonfield'],
+        'Django>=2.2', 'prices>=1.0.0', 'requests', 'jsonfield'],
+    extras_require={
+        'async': ['asgiref', 'httpx']},
+    python_requires='>=3.7',
     platforms=['any'],
     zip_safe=False)
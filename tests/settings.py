@@ -9,4 +9,17 @@ DATABASES = {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': 'database.sqlite'}}
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'default'},
+    'taxjar': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'taxjar'}}
+
 TAXJAR_ACCESS_KEY = os.environ.get('TAXJAR_ACCESS_KEY', '')
+
+# Check the shared version stamps on every lookup, so tests that write to
+# the database directly are seen at once.
+TAXJAR_LOCAL_RATES_CHECK_INTERVAL = 0
+TAXJAR_CATEGORIES_CHECK_INTERVAL = 0
@@ -1,13 +1,32 @@
+import asyncio
+import copy
+import json
+import pickle
+import random
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+
 import pytest
+import requests
+from django.core.cache import cache, caches
 from django.core.exceptions import ImproperlyConfigured
 from django.core.management import call_command
+from django.core.signals import request_finished, request_started
+from django.db import IntegrityError, transaction
 from django_prices_taxjar import utils
+from django_prices_taxjar.breaker import CircuitBreaker
+from django_prices_taxjar.caching import (
+    FrequencySketch, LocalCache, TieredCache)
+from django_prices_taxjar.instrumentation import (
+    cache_looked_up, db_queried, payload_measured)
 from django_prices_taxjar.models import Tax, TaxCategories
+from django_prices_taxjar.rate_table import RateTable
 from prices import Money, TaxedMoney
 
 
-from django_prices_taxjar import LineItem
-
+from django_prices_taxjar import LineItem, LineItemBatch
 
 @pytest.fixture
 def tax_country(db, json_success):
@@ -21,7 +40,10 @@ def tax_country(db, json_success):
         data['average_rate']['rate'] = str(data['average_rate']['rate'])
     except (KeyError):
         pass
-    return Tax.objects.create(country_code=data['country_code'], region_code=data['region_code'], data=data)
+    return Tax.objects.create(
+        country_code=data['country_code'], region_code=data['region_code'],
+        average_rate=data['average_rate']['rate'],
+        minimum_rate=data['minimum_rate']['rate'], data=data)
 
 
 @pytest.fixture
@@ -30,6 +52,48 @@ def rate_type(db, json_types_success):
         types=json_types_success['categories'])
 
 
+class FakeResponse(object):
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+class FakeSession(object):
+    def __init__(self, data):
+        self.data = data
+        self.calls = []
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs))
+        return FakeResponse(self.data)
+
+
+@pytest.fixture
+def fake_session(json_success_for_address):
+    session = FakeSession(json_success_for_address)
+    utils.set_session(session)
+    yield session
+    utils.set_session(None)
+
+
+@pytest.fixture
+def afetch_tax_rate_for_address_success(monkeypatch,
+                                        json_success_for_address):
+    async def afetch_tax_for_address(*args, **kwargs):
+        return json_success_for_address
+    monkeypatch.setattr(utils, 'afetch_tax_for_address',
+                        afetch_tax_for_address)
+
+
+@pytest.fixture
+def afetch_tax_rate_for_order_success(monkeypatch, json_success_for_order):
+    async def afetch_tax_for_order(*args, **kwargs):
+        return json_success_for_order
+    monkeypatch.setattr(utils, 'afetch_tax_for_order', afetch_tax_for_order)
+
+
 @pytest.fixture
 def fetch_tax_rates_success(monkeypatch, json_success):
     monkeypatch.setattr(utils, 'fetch_tax_rates', lambda: json_success)
@@ -50,6 +114,12 @@ def fetch_categories_error(monkeypatch, json_error):
     monkeypatch.setattr(utils, 'fetch_categories', lambda: json_error)
 
 
+@pytest.fixture
+def stream_tax_rates_success(monkeypatch, json_success):
+    monkeypatch.setattr(utils, 'stream_tax_rates',
+                        lambda: iter(json_success['summary_rates']))
+
+
 @pytest.fixture
 def fetch_tax_rate_for_address_success(monkeypatch, json_success_for_address):
     monkeypatch.setattr(utils, 'fetch_tax_for_address',
@@ -71,6 +141,46 @@ def test_validate_data_valid(json_success):
     assert utils.validate_data(json_success) is None
 
 
+def test_get_session_is_shared():
+    utils.set_session(None)
+    session = utils.get_session()
+    assert utils.get_session() is session
+    assert session.get_adapter(utils.TAXJAR_API)._pool_maxsize == \
+        utils.POOL_SIZE
+    utils.set_session(None)
+
+
+def test_fetch_tax_for_address_uses_session(fake_session):
+    utils.fetch_tax_for_address('05495-2086', {'country': 'US'})
+    utils.fetch_tax_for_address('05495-2086', {'country': 'US'})
+
+    assert len(fake_session.calls) == 2
+    method, url, kwargs = fake_session.calls[0]
+    assert method == 'get'
+    assert url == utils.TAXJAR_API + 'rates/05495-2086'
+    assert kwargs['params'] == {'country': 'US'}
+    assert kwargs['timeout'] == (
+        utils.CONNECT_TIMEOUT, utils.READ_TIMEOUT)
+
+
+def test_fetch_from_api_accepts_requests_function(fake_session):
+    utils.fetch_from_api(utils.TYPES_URL, requests.post)
+
+    assert fake_session.calls[0][0] == 'post'
+
+
+def test_settings_overrides(settings, fake_session):
+    settings.TAXJAR_API = 'http://localhost:8000/v2/'
+    utils.set_session(fake_session)
+    utils.fetch_tax_for_address('05495-2086', {})
+    assert fake_session.calls[0][1] == \
+        'http://localhost:8000/v2/rates/05495-2086'
+
+    del settings.TAXJAR_ACCESS_KEY
+    with pytest.raises(ImproperlyConfigured):
+        utils.create_session()
+
+
 @pytest.mark.django_db
 def test_create_objects_from_json_error(json_error, json_success):
     tax_counts = Tax.objects.count()
@@ -89,6 +199,175 @@ def test_create_objects_from_json_success(json_success):
     assert Tax.objects.count() == 3
 
 
+@pytest.mark.django_db
+def test_create_objects_from_json_updates_existing(
+        tax_country, json_success, django_assert_max_num_queries):
+    json_success['summary_rates'][0]['average_rate']['rate'] = 0.09
+
+    with django_assert_max_num_queries(6):
+        utils.create_objects_from_json(json_success)
+
+    assert Tax.objects.count() == 3
+    tax_country.refresh_from_db()
+    assert tax_country.data['average_rate']['rate'] == '0.09'
+    assert utils.get_tax_rates_for_region('CA', 'BC')['region'] == \
+        'British Columbia'
+
+
+@pytest.mark.django_db
+def test_create_objects_from_json_rate_columns(json_success):
+    utils.create_objects_from_json(json_success)
+
+    assert list(Tax.objects.filter(
+        average_rate__gte=Decimal('0.1')).order_by('country_code').values_list(
+            'country_code', 'average_rate', 'minimum_rate')) == [
+        ('CA', Decimal('0.12'), Decimal('0.05')),
+        ('UK', Decimal('0.2'), Decimal('0.2'))]
+
+
+@pytest.mark.django_db
+def test_tax_unique_country_without_region():
+    Tax.objects.create(country_code='UK', region_code=None, data={})
+    Tax.objects.create(country_code='UK', region_code='SC', data={})
+    with pytest.raises(IntegrityError), transaction.atomic():
+        Tax.objects.create(country_code='UK', region_code=None, data={})
+
+
+@pytest.mark.django_db(transaction=True)
+def test_refresh_tax_rates_publishes_on_commit(json_success):
+    key = utils._get_region_cache_key('US', 'CA')
+    with pytest.raises(RuntimeError), transaction.atomic():
+        utils.create_objects_from_json(json_success)
+        raise RuntimeError
+    assert utils.get_cache().get(key) is None
+    assert not Tax.objects.exists()
+
+    with transaction.atomic():
+        utils.create_objects_from_json(json_success)
+        assert utils.get_cache().get(key) is None
+    assert utils.get_cache().get(key) is not None
+
+
+@pytest.mark.django_db(transaction=True)
+def test_create_objects_from_json_diff(json_success):
+    first = utils.create_objects_from_json(copy.deepcopy(json_success))
+    assert first == {'added': 3, 'changed': 0, 'unchanged': 0, 'removed': 0}
+
+    cache.clear()
+    rates = copy.deepcopy(json_success)
+    removed = rates['summary_rates'].pop()
+    rates['summary_rates'][0]['average_rate']['rate'] = 0.09
+    second = utils.create_objects_from_json(rates)
+
+    assert second == {'added': 0, 'changed': 1, 'unchanged': 1, 'removed': 1}
+    assert not Tax.objects.filter(country_code=removed['country_code'])
+    assert cache.get(utils._get_region_cache_key('US', 'CA')) is not None
+    assert cache.get(utils._get_region_cache_key('CA', 'BC')) is None
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 10 ** 6])
+def test_iter_json_array(json_success, chunk_size):
+    body = json.dumps(json_success, indent=2).encode('utf-8')
+    chunks = [body[i:i + chunk_size]
+              for i in range(0, len(body), chunk_size)]
+
+    rates = list(utils.iter_json_array(chunks, 'summary_rates'))
+
+    assert rates == json_success['summary_rates']
+
+
+def test_iter_json_array_split_scalars():
+    chunks = ['{"a": [12', '34, tr', 'ue, "x",', ' 5', ']}']
+
+    assert list(utils.iter_json_array(chunks, 'a')) == [1234, True, 'x', 5]
+
+
+def test_iter_json_array_error(json_error):
+    with pytest.raises(ImproperlyConfigured):
+        list(utils.iter_json_array([json.dumps(json_error)], 'summary_rates'))
+
+
+@pytest.mark.django_db
+def test_get_tax_rates_command(stream_tax_rates_success,
+                               fetch_categories_success):
+    call_command('get_tax_rates', chunk_size=2)
+    assert Tax.objects.count() == 3
+    assert TaxCategories.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_get_tax_rates_command_dry_run(stream_tax_rates_success,
+                                       fetch_categories_success):
+    call_command('get_tax_rates', dry_run=True)
+    assert Tax.objects.count() == 0
+    assert TaxCategories.objects.count() == 0
+
+
+@pytest.mark.django_db
+def test_get_tax_rates_command_retries(monkeypatch, stream_tax_rates_success,
+                                       json_types_success):
+    calls = []
+
+    def fetch_categories():
+        calls.append(1)
+        if len(calls) == 1:
+            raise ConnectionError()
+        return json_types_success
+
+    monkeypatch.setattr(utils, 'fetch_categories', fetch_categories)
+    call_command('get_tax_rates', backoff=0)
+    assert len(calls) == 2
+    assert TaxCategories.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_get_tax_rates_command_retries_stream(monkeypatch, json_success,
+                                              fetch_categories_success):
+    calls = []
+
+    def stream_tax_rates():
+        calls.append(1)
+        rates = iter(json_success['summary_rates'])
+        yield next(rates)
+        if len(calls) == 1:
+            raise ConnectionError()
+        yield from rates
+
+    monkeypatch.setattr(utils, 'stream_tax_rates', stream_tax_rates)
+    call_command('get_tax_rates', chunk_size=1, backoff=0)
+    assert len(calls) == 2
+    assert Tax.objects.count() == 3
+
+
+@pytest.mark.django_db
+def test_get_tax_rates_command_retries_rate_limits(monkeypatch,
+                                                   taxjar_server):
+    taxjar_server.rate_limit_rate = 1
+    delays = []
+
+    def sleep(seconds):
+        delays.append(seconds)
+        taxjar_server.rate_limit_rate = 0
+
+    monkeypatch.setattr(utils.time, 'sleep', sleep)
+    call_command('get_tax_rates', backoff=0)
+
+    assert Tax.objects.count() == 3
+    assert TaxCategories.objects.count() == 1
+    # The fake server asks for one second with Retry-After.
+    assert delays[0] == 1
+    assert sum(count for (_, status), count in
+               taxjar_server.requests.items() if status == 429) >= 1
+
+
+@pytest.mark.django_db
+def test_get_tax_rates_command_categories_error(stream_tax_rates_success,
+                                                fetch_categories_error):
+    with pytest.raises(ImproperlyConfigured):
+        call_command('get_tax_rates')
+    assert Tax.objects.count() == 0
+
+
 @pytest.mark.django_db
 def test_save_tax_categories(json_types_success):
     utils.save_tax_categories(json_types_success)
@@ -104,6 +383,18 @@ def test_get_tax_categories(rate_type):
     assert categories == rate_type.types
 
 
+@pytest.mark.django_db(transaction=True)
+def test_get_tax_categories_cached(json_types_success,
+                                   django_assert_num_queries):
+    utils.save_tax_categories(json_types_success)
+
+    with django_assert_num_queries(0):
+        assert utils.get_tax_categories() == json_types_success['categories']
+        assert utils.get_tax_category('81100')['name'] == 'Books'
+        assert utils.is_valid_product_tax_code('20010')
+        assert not utils.is_valid_product_tax_code('00000')
+
+
 @pytest.mark.django_db
 def test_get_tax_categories_no_categories():
     categories = utils.get_tax_categories()
@@ -126,6 +417,34 @@ def test_get_tax_rates_for_country_invalid_code():
     assert tax_rates is None
 
 
+@pytest.mark.django_db
+def test_get_tax_rates_for_region_caches_missing_region(
+        django_assert_num_queries):
+    with django_assert_num_queries(1):
+        assert utils.get_tax_rates_for_region('XX') is None
+        assert utils.get_tax_rates_for_region('XX') is None
+
+
+@pytest.mark.django_db(transaction=True)
+def test_get_tax_rates_for_region_local_rates(settings, tax_country,
+                                              json_success,
+                                              django_assert_num_queries):
+    settings.TAXJAR_LOCAL_RATES = True
+
+    with django_assert_num_queries(1):
+        tax_rates = utils.get_tax_rates_for_region('US', 'CA')
+        assert utils.get_tax_rates_for_region('XX') is None
+    assert tax_rates['average_rate']['rate'] == '0.0827'
+    assert utils.get_region_rates('US', 'CA').average_rate == \
+        Decimal('0.0827')
+
+    json_success['summary_rates'][0]['average_rate']['rate'] = 0.09
+    utils.create_objects_from_json(json_success)
+    assert utils.get_region_rates('US', 'CA').average_rate == \
+        Decimal('0.09')
+    utils.bump_rates_version()
+
+
 def test_get_tax_rate_standard_rate(tax_country):
     tax_rates = tax_country.data
     standard_rate = utils.get_tax_rate(tax_rates)
@@ -186,6 +505,23 @@ def test_get_tax_for_rate_reduced_rate(tax_country):
         net=Money('92.36', 'USD'), gross=Money(100, 'USD'))
 
 
+def test_get_tax_for_rate_memoized(tax_country):
+    tax_rates = tax_country.data
+    assert utils.get_tax_for_rate(tax_rates) is \
+        utils.get_tax_for_rate(tax_rates)
+
+
+@pytest.mark.parametrize('keep_gross', [False, True])
+def test_tax_apply_many(keep_gross):
+    bases = [
+        Money('100', 'USD'), Money('0.33', 'USD'), Money('17', 'JPY'),
+        TaxedMoney(net=Money('15', 'USD'), gross=Money('15.5', 'USD'))]
+
+    for tax in [utils.get_flat_tax('0.0827'), utils.get_amount_tax('1.35')]:
+        assert tax.apply_many(bases, keep_gross=keep_gross) == [
+            tax(base, keep_gross=keep_gross) for base in bases]
+
+
 def test_get_tax_for_address(fetch_tax_rate_for_address_success):
     tax_for_address = utils.get_tax_for_address(
         '05495-2086', 'US', 'VT', 'Williston', '312 Hurricane Lane')
@@ -208,6 +544,193 @@ def test_get_shipping_taxable_for_address(fetch_tax_rate_for_address_success):
     assert shipping_taxable_for_address == True
 
 
+def test_make_address_cache_key():
+    key = utils.make_address_cache_key(
+        '05495-2086', 'US', 'VT', 'Williston', '312 Hurricane Lane')
+
+    assert key.startswith('taxjar_rates:')
+    assert key == utils.make_address_cache_key(
+        ' 05495-2086', 'us', 'vt', 'WILLISTON', '312  hurricane lane ')
+    assert key != utils.make_address_cache_key(
+        '05495-2086', 'US', 'VT', 'Williston')
+    long_key = utils.make_address_cache_key(
+        '10115', 'DE', None, 'Berlin', 'Straße des 17. Juni ' * 20)
+    assert len(long_key) == len(key)
+
+
+def test_get_rates_for_address_uses_cache_alias(
+        settings, fetch_tax_rate_for_address_success):
+    settings.TAXJAR_CACHE_ALIAS = 'taxjar'
+    utils.get_rates_for_address('05495-2086', 'US', 'VT')
+
+    key = utils.make_address_cache_key('05495-2086', 'US', 'VT')
+    assert caches['taxjar'].get(key) is not None
+    assert caches['default'].get(key) is None
+
+
+def test_get_rates_for_address_local_cache_tier(
+        settings, fetch_tax_rate_for_address_success):
+    settings.TAXJAR_LOCAL_CACHE_MAX_ENTRIES = 100
+    utils.get_rates_for_address('05495-2086', 'US', 'VT')
+    caches['default'].clear()
+
+    address_rates = utils.get_rates_for_address('05495-2086', 'US', 'VT')
+
+    assert address_rates.combined_rate == Decimal('0.07')
+    stats = utils.get_cache_stats()
+    assert stats['local_hits'] == 1
+    assert stats['shared_misses'] == 1
+
+
+def test_tiered_cache_invalidate():
+    shared = caches['taxjar']
+    first = TieredCache(shared, LocalCache(10, 60), 'version', 0)
+    second = TieredCache(shared, LocalCache(10, 60), 'version', 0)
+    first.set('key', 'old', 60)
+    assert second.get('key') == 'old'
+
+    shared.set('key', 'new', 60)
+    assert second.get('key') == 'old'
+    assert second.stats['local_hits'] == 1
+
+    first.invalidate()
+    assert second.get('key') == 'new'
+
+
+def test_get_rates_for_address(fetch_tax_rate_for_address_success):
+    address_rates = utils.get_rates_for_address('05495-2086', 'US', 'VT')
+
+    assert address_rates.combined_rate == Decimal('0.07')
+    assert address_rates.freight_taxable is True
+    assert address_rates.components['state_rate'] == Decimal('0.06')
+    assert address_rates.components['combined_district_rate'] == \
+        Decimal('0.01')
+    assert 'combined_rate' not in address_rates.components
+
+
+@pytest.mark.django_db
+def test_get_rates_for_address_memoized_per_request(
+        monkeypatch, json_success_for_address):
+    calls = []
+
+    def fetch_tax_for_address(*args, **kwargs):
+        calls.append(args)
+        return json_success_for_address
+
+    monkeypatch.setattr(utils, 'fetch_tax_for_address', fetch_tax_for_address)
+    request_started.send(sender=None)
+    try:
+        utils.get_tax_for_address('05495-2086', 'US')
+        cache.clear()
+        assert utils.is_shipping_taxable_for_address('05495-2086', 'US')
+        assert len(calls) == 1
+    finally:
+        request_finished.send(sender=None)
+
+    cache.clear()
+    utils.get_tax_for_address('05495-2086', 'US')
+    assert len(calls) == 2
+
+
+def test_get_taxes_for_addresses(monkeypatch, json_success_for_address):
+    calls = []
+
+    def fetch_tax_for_address(postal_code, address_data):
+        calls.append(postal_code)
+        data = {'rate': dict(json_success_for_address['rate'])}
+        if postal_code == '90002':
+            data['rate']['combined_rate'] = '0.1025'
+        return data
+
+    monkeypatch.setattr(utils, 'fetch_tax_for_address', fetch_tax_for_address)
+    utils.get_tax_for_address('05495-2086', 'US')
+    addresses = [
+        {'postal_code': '90002', 'country_code': 'US'},
+        {'postal_code': '05495-2086', 'country_code': 'US'},
+        {'postal_code': '90002', 'country_code': 'US'}]
+
+    taxes = utils.get_taxes_for_addresses(addresses)
+
+    assert calls == ['05495-2086', '90002']
+    assert [tax(Money(100, 'USD')).gross for tax in taxes] == [
+        Money('110.25', 'USD'), Money('107.00', 'USD'),
+        Money('110.25', 'USD')]
+    utils.get_taxes_for_addresses(addresses)
+    assert len(calls) == 2
+
+
+def test_get_tax_for_address_single_flight(monkeypatch,
+                                           json_success_for_address):
+    calls = []
+
+    def fetch_tax_for_address(*args, **kwargs):
+        calls.append(args)
+        time.sleep(0.1)
+        return json_success_for_address
+
+    monkeypatch.setattr(utils, 'fetch_tax_for_address', fetch_tax_for_address)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(
+            utils.is_shipping_taxable_for_address('05495-2086', 'US')))
+        for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [True] * 5
+
+
+def test_get_tax_for_address_failed_refresh_releases_waiters(monkeypatch):
+    def fetch_tax_for_address(*args, **kwargs):
+        time.sleep(0.1)
+        raise ConnectionError()
+
+    monkeypatch.setattr(utils, 'fetch_tax_for_address', fetch_tax_for_address)
+    errors = []
+
+    def lookup():
+        try:
+            utils.get_rates_for_address('10001', 'US', 'NY')
+        except ConnectionError as error:
+            errors.append(error)
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=lookup) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(errors) == 3
+    assert time.monotonic() - started < utils.CACHE_LOCK_TIMEOUT / 2
+    key = utils.make_address_cache_key('10001', 'US', 'NY')
+    assert utils.get_cache().get(key + ':lock') is None
+
+
+def test_get_tax_for_address_early_refresh(monkeypatch, settings,
+                                           json_success_for_address):
+    calls = []
+
+    def fetch_tax_for_address(*args, **kwargs):
+        calls.append(args)
+        time.sleep(0.01)
+        return json_success_for_address
+
+    monkeypatch.setattr(utils, 'fetch_tax_for_address', fetch_tax_for_address)
+    monkeypatch.setattr(utils.random, 'random', lambda: 0.5)
+    utils.get_tax_for_address('05495-2086', 'US')
+    utils.get_tax_for_address('05495-2086', 'US')
+    assert len(calls) == 1
+
+    # A huge beta makes an early refresh certain.
+    settings.TAXJAR_CACHE_EARLY_REFRESH_BETA = 10 ** 12
+    utils.get_tax_for_address('05495-2086', 'US')
+    assert len(calls) == 2
+
+
 def test_get_taxes_for_order(fetch_tax_rate_for_order_success):
     tax_for_order = utils.get_taxes_for_order(
         Money('1.5', 'USD'), 'US', '90002', 'CA', 'Los Angeles',
@@ -226,3 +749,503 @@ def test_get_taxes_for_order(fetch_tax_rate_for_order_success):
         net=Money(15, 'USD'), gross=Money('16.35', 'USD'))
     assert tax_for_order(taxed_money, keep_gross=True) == TaxedMoney(
         net=Money('13.65', 'USD'), gross=Money(15, 'USD'))
+
+
+def test_aget_tax_for_address(afetch_tax_rate_for_address_success):
+    tax_for_address = asyncio.run(utils.aget_tax_for_address(
+        '05495-2086', 'US', 'VT', 'Williston', '1 Async Lane'))
+
+    assert tax_for_address(Money(100, 'USD')) == TaxedMoney(
+        net=Money(100, 'USD'), gross=Money('107.00', 'USD'))
+    assert asyncio.run(utils.ais_shipping_taxable_for_address(
+        '05495-2086', 'US', 'VT', 'Williston', '1 Async Lane')) is True
+
+
+def test_async_api_requires_asgiref(monkeypatch):
+    monkeypatch.setattr(utils, 'sync_to_async', None)
+    with pytest.raises(ImproperlyConfigured):
+        asyncio.run(utils.aget_tax_rates_for_region('US', 'CA'))
+
+
+def test_async_cache_io_runs_on_thread_pool(
+        monkeypatch, settings, afetch_tax_rate_for_address_success):
+    settings.TAXJAR_HOT_ADDRESSES = 10
+    settings.TAXJAR_HOT_ADDRESSES_FLUSH_INTERVAL = 0
+    sync_to_async = utils.sync_to_async
+    calls = []
+
+    def spy(function, thread_sensitive=True):
+        calls.append((function.__name__, thread_sensitive))
+        return sync_to_async(function, thread_sensitive=thread_sensitive)
+
+    monkeypatch.setattr(utils, 'sync_to_async', spy)
+    asyncio.run(utils.aget_tax_for_address(
+        '05495-2086', 'US', 'VT', 'Williston', '1 Async Lane'))
+
+    assert ('get', False) in calls
+    assert ('set', False) in calls
+    assert ('flush_hot_addresses', False) in calls
+    assert utils.get_hot_addresses()[0]['postal_code'] == '05495-2086'
+
+
+def test_aget_taxes_for_order(afetch_tax_rate_for_order_success):
+    tax_for_order = asyncio.run(utils.aget_taxes_for_order(
+        Money('1.5', 'USD'), 'US', '90002', 'CA', 'Los Angeles',
+        '1335 E 103rd St', None,
+        [
+            LineItem('1', 1, Money(15, 'USD'), '20010')
+        ]
+    ))
+    assert tax_for_order(Money(15, 'USD')) == TaxedMoney(
+        net=Money(15, 'USD'), gross=Money('16.35', 'USD'))
+
+
+def test_afetch_tax_for_address_uses_async_client(json_success_for_address):
+    httpx = pytest.importorskip('httpx')
+    requests_made = []
+
+    def handler(request):
+        requests_made.append(request)
+        return httpx.Response(200, json=json_success_for_address)
+
+    async def fetch():
+        utils.set_async_client(
+            httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+        try:
+            return await utils.afetch_tax_for_address(
+                '05495-2086', {'country': 'US'})
+        finally:
+            utils.set_async_client(None)
+
+    assert asyncio.run(fetch()) == json_success_for_address
+    assert requests_made[0].url.path == '/v2/rates/05495-2086'
+    assert requests_made[0].url.params['country'] == 'US'
+
+
+def test_line_item_immutable():
+    item = LineItem('1', 2, Money(15, 'USD'), discount=Money(5, 'USD'))
+    assert item.dictionary is item.dictionary
+    assert item.dictionary == {
+        'id': '1', 'quantity': 2, 'unit_price': '15',
+        'product_tax_code': '', 'discount': '5'}
+    with pytest.raises(AttributeError):
+        item.quantity = 3
+
+
+def test_line_item_copy_and_pickle():
+    item = LineItem('1', 2, Money(15, 'USD'), '20010', Money(5, 'USD'))
+    for clone in [copy.copy(item), copy.deepcopy(item),
+                  pickle.loads(pickle.dumps(item))]:
+        assert clone is not item
+        assert repr(clone) == repr(item)
+        assert clone.dictionary == item.dictionary
+
+
+def test_get_taxes_for_order_line_item_batch(monkeypatch,
+                                             json_success_for_order):
+    calls = []
+
+    def fetch_tax_for_order(order_data):
+        calls.append(order_data)
+        return json_success_for_order
+
+    monkeypatch.setattr(utils, 'fetch_tax_for_order', fetch_tax_for_order)
+    items = [
+        LineItem('1', 1, Money(15, 'USD'), '20010'),
+        LineItem('2', 3, Money(2, 'USD'), discount=Money(1, 'USD'))]
+    batch = LineItemBatch()
+    for item in items:
+        batch.append(item.id, item.quantity, item.unit_price,
+                     item.product_tax_code, item.discount)
+
+    utils.get_taxes_for_order(
+        Money('1.5', 'USD'), 'US', '90002', 'CA', line_items=batch)
+
+    assert len(batch) == 2
+    assert calls[0]['line_items'] == [item.dictionary for item in items]
+    assert [item.dictionary for item in batch] == calls[0]['line_items']
+
+
+def test_get_taxes_for_order_cached(monkeypatch, settings,
+                                    json_success_for_order):
+    calls = []
+
+    def fetch_tax_for_order(order_data):
+        calls.append(order_data)
+        return json_success_for_order
+
+    monkeypatch.setattr(utils, 'fetch_tax_for_order', fetch_tax_for_order)
+    settings.TAXJAR_ORDER_CACHE_TTL = 60
+
+    def get_taxes(quantity):
+        return utils.get_taxes_for_order(
+            Money('1.5', 'USD'), 'US', '90002', 'CA',
+            line_items=[LineItem('1', quantity, Money(15, 'USD'), '20010')])
+
+    assert get_taxes(1) is get_taxes(1)
+    assert len(calls) == 1
+    get_taxes(2)
+    assert len(calls) == 2
+
+
+def test_local_cache_bounds():
+    local_cache = LocalCache(2, 60)
+    local_cache.set('a', 1)
+    local_cache.set('b', 2)
+    assert local_cache.get('a') == 1
+    local_cache.set('c', 3)
+    assert local_cache.get('b') is None
+    assert local_cache.get('a') == 1
+
+    local_cache.set('d', 4, timeout=0)
+    assert local_cache.get('d') is None
+
+
+def test_estimate_taxes_for_order(fetch_tax_rate_for_address_success):
+    tax_for_order = utils.estimate_taxes_for_order(
+        Money('1.5', 'USD'), 'US', '05495-2086', 'VT', 'Williston', None,
+        None,
+        [
+            LineItem('1', 2, Money(15, 'USD'), '20010',
+                     discount=Money(5, 'USD')),
+            LineItem('2', 1, Money(10, 'USD'), '99999')
+        ]
+    )
+    # (2 * 15 - 5 + 1.5 shipping) * 0.07
+    assert tax_for_order(Money(15, 'USD')) == TaxedMoney(
+        net=Money(15, 'USD'), gross=Money('16.86', 'USD'))
+
+
+def test_estimate_taxes_for_order_region_rate(tax_country):
+    tax_for_order = utils.estimate_taxes_for_order(
+        Money('1.5', 'USD'), 'US', region_code='CA', amount=Money(100, 'USD'))
+    assert tax_for_order(Money(100, 'USD')) == TaxedMoney(
+        net=Money(100, 'USD'), gross=Money('108.27', 'USD'))
+
+
+@pytest.mark.django_db
+def test_estimate_taxes_for_order_unknown_region():
+    assert utils.estimate_taxes_for_order(
+        Money('1.5', 'USD'), 'US', region_code='ZZ',
+        amount=Money(100, 'USD')) is None
+
+
+@pytest.fixture
+def rate_table(tmp_path, settings):
+    source = tmp_path / 'rates.csv'
+    source.write_text(
+        'zip,country,state,state_rate,county_rate,city_rate,'
+        'combined_district_rate,combined_rate,freight_taxable\n'
+        '05495,US,VT,0.06,0.0,0.0,0.01,0.07,true\n'
+        '90210,US,CA,0.0625,0.0025,0.0,0.0375,0.1025,false\n')
+    path = str(tmp_path / 'rates.bin')
+    call_command('import_tax_rate_table', str(source), output=path)
+    settings.TAXJAR_RATE_TABLE_PATH = path
+    return path
+
+
+def test_rate_table_lookup(rate_table):
+    table = RateTable(rate_table)
+
+    assert len(table) == 2
+    assert table.get('90210')['combined_rate'] == '0.1025'
+    assert table.get('05495-2086', 'us') == {
+        'zip': '05495', 'country': 'US', 'state': 'VT',
+        'country_rate': '0', 'state_rate': '0.06', 'county_rate': '0',
+        'city_rate': '0', 'combined_district_rate': '0.01',
+        'combined_rate': '0.07', 'freight_taxable': True}
+    assert table.get('10001') is None
+    assert table.get('05495', 'CA') is None
+    table.close()
+
+
+def test_get_tax_for_address_uses_rate_table(
+        monkeypatch, rate_table, json_success_for_address):
+    calls = []
+
+    def fetch_tax_for_address(postal_code, address_data):
+        calls.append(postal_code)
+        return json_success_for_address
+
+    monkeypatch.setattr(utils, 'fetch_tax_for_address', fetch_tax_for_address)
+    tax_for_address = utils.get_tax_for_address('05495-2086', 'US', 'VT')
+
+    assert tax_for_address(Money(100, 'USD')) == TaxedMoney(
+        net=Money(100, 'USD'), gross=Money('107.00', 'USD'))
+    assert utils.get_rates_for_addresses([
+        {'postal_code': '90210'}, {'postal_code': '10001'}])[0] \
+        .combined_rate == Decimal('0.1025')
+    assert calls == ['10001']
+
+    utils.get_tax_for_address(
+        '05495-2086', 'US', 'VT', 'Williston', '312 Hurricane Lane')
+    assert calls == ['10001', '05495-2086']
+
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker(2, 60, latency_budget=1)
+    breaker.record_failure()
+    assert breaker.allow()
+
+    breaker.record_success(2)
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+
+    breaker._opened -= 60
+    assert breaker.allow()
+    assert breaker.state == 'half-open'
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+
+
+class FailingSession(object):
+    def request(self, method, url, **kwargs):
+        raise ConnectionError(url)
+
+
+@pytest.mark.django_db
+def test_get_rates_for_address_circuit_open(
+        settings, fake_session, tax_country):
+    settings.TAXJAR_CIRCUIT_FAILURE_THRESHOLD = 1
+    utils.set_session(fake_session)
+    utils.get_rates_for_address('05495-2086', 'US', 'VT')
+    key = utils.make_address_cache_key('05495-2086', 'US', 'VT')
+    cache.set(key, cache.get(key)._replace(expires=0))
+
+    # A failed refresh serves the expired copy, then the region's summary
+    # rate once the circuit is open.
+    utils.set_session(FailingSession())
+    assert utils.get_rates_for_address(
+        '05495-2086', 'US', 'VT').combined_rate == Decimal('0.07')
+    breaker = utils.get_circuit_breaker()
+    assert breaker.state == 'open'
+    assert utils.get_rates_for_address(
+        '05495-2086', 'US', 'VT').combined_rate == Decimal('0.07')
+    assert utils.get_rates_for_address(
+        '90210', 'US', 'CA').combined_rate == Decimal('0.0827')
+    with pytest.raises(utils.CircuitOpenError):
+        utils.get_rates_for_address('10001', 'US', 'NY')
+
+    # Once the probe is due, the copy is revalidated in the background.
+    utils.set_session(fake_session)
+    breaker._opened -= breaker.reset_timeout
+    utils.get_rates_for_address('05495-2086', 'US', 'VT')
+    deadline = time.monotonic() + 1
+    while breaker.state != 'closed' and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert breaker.state == 'closed'
+    assert len(fake_session.calls) == 2
+
+
+@pytest.mark.django_db
+def test_get_rates_for_address_failed_refresh_serves_stale(
+        settings, fake_session):
+    settings.TAXJAR_CIRCUIT_FAILURE_THRESHOLD = 5
+    utils.set_session(fake_session)
+    utils.get_rates_for_address('05495-2086', 'US', 'VT')
+    key = utils.make_address_cache_key('05495-2086', 'US', 'VT')
+    cache.set(key, cache.get(key)._replace(expires=0))
+
+    utils.set_session(FailingSession())
+    assert utils.get_rates_for_address(
+        '05495-2086', 'US', 'VT').combined_rate == Decimal('0.07')
+    assert utils.get_rates_for_addresses([{
+        'postal_code': '05495-2086', 'country_code': 'US',
+        'region_code': 'VT'}])[0].combined_rate == Decimal('0.07')
+    assert utils.get_circuit_breaker().state == 'closed'
+    with pytest.raises(ConnectionError):
+        utils.get_rates_for_address('10001', 'US', 'NY')
+
+
+def test_frequency_sketch():
+    sketch = FrequencySketch(2, width=64)
+    for item, count in [('a', 5), ('b', 1), ('c', 3)]:
+        for _ in range(count):
+            sketch.record(item, item.upper())
+
+    assert [(item, value) for item, _, value in sketch.most_common()] == [
+        ('a', 'A'), ('c', 'C')]
+
+
+def test_frequency_sketch_evicts_coldest():
+    generator = random.Random(0)
+    items = ['hot{}'.format(index) for index in range(5)] * 50 + [
+        'cold{}'.format(index) for index in range(200)]
+    generator.shuffle(items)
+    sketch = FrequencySketch(5, width=1024)
+    for item in items:
+        sketch.record(item)
+
+    assert {item for item, _, _ in sketch.most_common()} == {
+        item for item, _ in Counter(items).most_common(5)}
+    assert len(sketch._heap) == 5
+
+
+@pytest.mark.django_db
+def test_warm_tax_cache_command(settings, monkeypatch, tax_country,
+                                json_success_for_address):
+    settings.TAXJAR_HOT_ADDRESSES = 10
+    calls = []
+
+    def fetch_tax_for_address(postal_code, address_data):
+        calls.append(postal_code)
+        return json_success_for_address
+
+    monkeypatch.setattr(utils, 'fetch_tax_for_address', fetch_tax_for_address)
+    for postal_code in ['05495', '05495', '90210']:
+        utils.get_rates_for_address(postal_code, 'US')
+    cache.clear()
+
+    call_command('warm_tax_cache', concurrency=2)
+
+    assert cache.get(utils._get_region_cache_key('US', 'CA')) is not None
+    assert sorted(calls) == ['05495', '05495', '90210', '90210']
+    assert utils.get_hot_addresses() == [
+        {'postal_code': '05495', 'country_code': 'US', 'region_code': None,
+         'city': None, 'street': None}]
+    utils.get_rates_for_address('90210', 'US')
+    assert len(calls) == 4
+
+
+@pytest.mark.django_db
+def test_warm_cache_skips_failed_addresses(settings, monkeypatch, tax_country,
+                                           json_success_for_address):
+    settings.TAXJAR_HOT_ADDRESSES = 10
+    failing = {'00000', '99999'}
+
+    def fetch_tax_for_address(postal_code, address_data):
+        if postal_code in failing:
+            raise ImproperlyConfigured('Invalid postal code')
+        return json_success_for_address
+
+    monkeypatch.setattr(utils, 'fetch_tax_for_address', fetch_tax_for_address)
+    with pytest.raises(ImproperlyConfigured):
+        utils.get_rates_for_address('99999', 'US')
+    failing.discard('00000')
+    for postal_code in ['00000', '05495']:
+        utils.get_rates_for_address(postal_code, 'US')
+    assert {address[0] for _, _, address in
+            utils._get_hot_addresses().most_common()} == {'00000', '05495'}
+    cache.clear()
+    failing.add('00000')
+
+    stats = utils.warm_cache()
+
+    assert stats['addresses'] == 1
+    assert stats['failed'] == 1
+    assert cache.get(utils.make_address_cache_key('05495', 'US')) is not None
+    assert cache.get(utils.make_address_cache_key('00000', 'US')) is None
+
+
+def test_metrics_registry(settings, fake_session,
+                          fetch_tax_rate_for_order_success):
+    settings.TAXJAR_INSTRUMENTATION = \
+        'django_prices_taxjar.instrumentation.MetricsRegistry'
+    utils.set_session(fake_session)
+    registry = utils.get_instrumentation()
+    utils.get_rates_for_address('05495-2086', 'US')
+    utils.get_rates_for_address('05495-2086', 'US')
+    utils.get_taxes_for_order(
+        Money('1.5', 'USD'), 'US', '90002', 'CA',
+        line_items=[LineItem('1', 1, Money(15, 'USD'), '20010')])
+
+    api_labels = {'endpoint': 'rates/{postal_code}', 'method': 'get'}
+    assert registry.get_sample_value(
+        'taxjar_api_responses_total', status='200', **api_labels) == 1
+    assert registry.get_sample_value(
+        'taxjar_api_request_duration_seconds_count', **api_labels) == 1
+    for outcome in ['hit', 'miss']:
+        assert registry.get_sample_value(
+            'taxjar_cache_lookups_total', cache='address', tier='shared',
+            outcome=outcome) == 1
+    assert registry.get_sample_value(
+        'taxjar_payload_size_bytes_count', payload='order') == 1
+    assert 'taxjar_api_request_duration_seconds_bucket{' \
+        'endpoint="rates/{postal_code}",method="get",le="+Inf"} 1' \
+        in registry.render()
+
+
+def test_signal_instrumentation(tax_country):
+    events = []
+
+    def receiver(signal, sender, **kwargs):
+        events.append(kwargs.get('outcome') or kwargs['query'])
+
+    cache_looked_up.connect(receiver)
+    db_queried.connect(receiver)
+    try:
+        utils.get_tax_rates_for_region('US', 'CA')
+        utils.get_tax_rates_for_region('US', 'CA')
+    finally:
+        cache_looked_up.disconnect(receiver)
+        db_queried.disconnect(receiver)
+
+    assert events == ['miss', 'region', 'hit']
+
+
+def test_payload_measured_only_with_receivers(monkeypatch,
+                                              json_success_for_order):
+    monkeypatch.setattr(utils, 'fetch_tax_for_order',
+                        lambda order_data: json_success_for_order)
+    encode_order_data = utils._encode_order_data
+    payloads = []
+    sizes = []
+
+    def spy(order_data, measure):
+        payloads.append(encode_order_data(order_data, measure))
+        return payloads[-1]
+
+    def receiver(signal, sender, size, **kwargs):
+        sizes.append(size)
+
+    def get_taxes():
+        utils.get_taxes_for_order(
+            Money('1.5', 'USD'), 'US', '90002', 'CA',
+            line_items=[LineItem('1', 1, Money(15, 'USD'), '20010')])
+
+    monkeypatch.setattr(utils, '_encode_order_data', spy)
+    get_taxes()
+    payload_measured.connect(receiver)
+    try:
+        get_taxes()
+    finally:
+        payload_measured.disconnect(receiver)
+
+    assert payloads[0] is None
+    assert sizes == [len(payloads[1])]
+
+
+@pytest.mark.django_db
+def test_get_rates_for_address_over_http(taxjar_server):
+    rates = utils.get_rates_for_address('05495-2086', 'US', 'VT')
+    assert rates.combined_rate == Decimal('0.07')
+    tax = utils.get_taxes_for_order(
+        Money('1.5', 'USD'), 'US', '05495-2086', 'VT',
+        line_items=[LineItem('7', 1, Money('15', 'USD'))])
+    assert tax.amount == Decimal('1.35')
+    assert taxjar_server.requests == {
+        ('/v2/rates/{zip}', 200): 1, ('/v2/taxes', 200): 1}
+
+
+
+def test_stream_tax_rates_is_instrumented(settings, taxjar_server):
+    settings.TAXJAR_INSTRUMENTATION = \
+        'django_prices_taxjar.instrumentation.MetricsRegistry'
+    rates = list(utils.stream_tax_rates())
+
+    assert len(rates) == 3
+    assert utils.get_instrumentation().get_sample_value(
+        'taxjar_api_responses_total', endpoint='summary_rates',
+        method='get', status='200') == 1
+
+@pytest.mark.django_db
+def test_rate_limited_responses_open_circuit(settings, taxjar_server):
+    settings.TAXJAR_CIRCUIT_FAILURE_THRESHOLD = 1
+    taxjar_server.rate_limit_rate = 1
+    with pytest.raises(ImproperlyConfigured):
+        utils.get_rates_for_address('10001', 'US', 'NY')
+    assert utils.get_circuit_breaker().state == 'open'
+    with pytest.raises(utils.CircuitOpenError):
+        utils.get_rates_for_address('10001', 'US', 'NY')
+    assert taxjar_server.requests == {('/v2/rates/{zip}', 429): 1}